@@ -0,0 +1,139 @@
+"""
+Registry of correction backends, and a scheduler that runs them concurrently.
+
+A backend corrects a batch of sentences with one tool. Backends are registered for one or more tool
+ids with the ``register_backend`` decorator, and declare the resource they mostly use ("gpu",
+"cpu", "network" or "io"). The scheduler runs the backends sharing a resource one after another,
+so e.g. two models never compete for the GPU, while backends on different resources run at the
+same time, so the network-bound Skrambi requests overlap with parsing and model inference.
+
+``correct_batch`` may be a plain method or a coroutine. Plain methods are run in a worker thread.
+Backends that produce their output incrementally call ``on_corrected(index, output)`` for each
+sentence as soon as it is done, so the caller can checkpoint it; the others may ignore it.
+"""
+
+import asyncio
+import inspect
+
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Type
+
+OnCorrected = Callable[[int, str], None]
+
+
+class CorrectionBackend:
+    """Corrects sentences with one tool. Subclasses implement ``correct_batch``."""
+
+    resource = "cpu"
+    # whether the outputs are worth checkpointing, i.e. are expensive to produce
+    journaled = True
+
+    def __init__(self, tool: str, config: dict):
+        self.tool = tool
+        self.config = config
+
+    def correct_batch(
+        self, sentences: List[str], on_corrected: OnCorrected = None
+    ) -> List[str]:
+        raise NotImplementedError
+
+    def identity(self) -> Optional[str]:
+        """What the output depends on besides the sentence, for caching, or None to never cache."""
+        return None
+
+    async def correct(
+        self, sentences: List[str], on_corrected: OnCorrected = None
+    ) -> List[str]:
+        """Run ``correct_batch``, in a worker thread unless it is a coroutine."""
+        if inspect.iscoroutinefunction(self.correct_batch):
+            return await self.correct_batch(sentences, on_corrected)
+        return await asyncio.to_thread(self.correct_batch, sentences, on_corrected)
+
+    async def correct_example_sets(
+        self, example_sets: Dict[int, List[str]], on_corrected: OnCorrected = None
+    ) -> Dict[int, List[str]]:
+        """Correct all example sets in one batch and split the output back per set.
+
+        The indices passed to ``on_corrected`` are into the concatenated example sets.
+        """
+        sentences = [sent for example_set in example_sets.values() for sent in example_set]
+        corrected = await self.correct(sentences, on_corrected)
+        corrected_sets = {}
+        offset = 0
+        for i, example_set in example_sets.items():
+            corrected_sets[i] = corrected[offset : offset + len(example_set)]
+            offset += len(example_set)
+        return corrected_sets
+
+
+BACKENDS: Dict[str, Type[CorrectionBackend]] = {}
+
+
+def register_backend(*tools: str) -> Callable[[Type[CorrectionBackend]], Type[CorrectionBackend]]:
+    """Class decorator registering a backend for the given tool ids."""
+
+    def register(backend: Type[CorrectionBackend]) -> Type[CorrectionBackend]:
+        for tool in tools:
+            BACKENDS[tool] = backend
+        return backend
+
+    return register
+
+
+def create_backend(
+    tool: str, config: dict, fallback: Type[CorrectionBackend] = None
+) -> Optional[CorrectionBackend]:
+    """The backend registered for the tool, or the fallback, or None if there is neither."""
+    backend = BACKENDS.get(tool, fallback)
+    if backend is None:
+        return None
+    return backend(tool, config)
+
+
+class SchedulingError(Exception):
+    """Raised by ``schedule`` when jobs failed, after all the other jobs have run.
+
+    Attributes:
+        failures: The exception of each failed job, by name.
+        results: The result of each job that succeeded, by name.
+    """
+
+    def __init__(self, failures: Dict[str, Exception], results: Dict[str, object]):
+        self.failures = failures
+        self.results = results
+        details = "; ".join(
+            f"{name}: {type(error).__name__}: {error}" for name, error in failures.items()
+        )
+        super().__init__(
+            f"{len(failures)} of {len(failures) + len(results)} jobs failed: {details}"
+        )
+
+
+async def schedule(
+    jobs: Dict[str, Callable[[], Awaitable]], resources: Dict[str, str]
+) -> Dict[str, object]:
+    """Run the jobs, sequentially within a resource group and concurrently across groups.
+
+    ``jobs`` maps a name to a coroutine function and ``resources`` maps the name to its resource.
+    Returns the result of each job by name. A failing job does not stop the others, not even those
+    later in its resource group, and the failures are raised together in a ``SchedulingError``
+    once every job has run.
+    """
+    groups = defaultdict(list)
+    for name in jobs:
+        groups[resources[name]].append(name)
+
+    results = {}
+    failures = {}
+
+    async def run_group(names: List[str]) -> None:
+        for name in names:
+            try:
+                results[name] = await jobs[name]()
+            except Exception as error:
+                failures[name] = error
+
+    await asyncio.gather(*(run_group(names) for names in groups.values()))
+    if failures:
+        raise SchedulingError(failures, results)
+    return results
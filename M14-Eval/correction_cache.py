@@ -0,0 +1,134 @@
+"""
+Persistent, content-addressed cache of tool corrections, stored in an SQLite file.
+
+Each entry is keyed by a hash of the backend identity (tool id, a fingerprint of the model
+checkpoint and the generation parameters) and the input sentence, and holds the corrected sentence.
+It is shared across runs, example sets and benchmark revisions, so after a benchmark edit only the
+changed sentences are corrected again. The number of entries is capped, evicting the least recently
+used entries first.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+
+from hashlib import sha256
+from typing import Dict, Iterable, List, Tuple
+
+# number of keys per SQLite query, well below the limit on query parameters
+_QUERY_CHUNK_SIZE = 500
+
+
+def checkpoint_fingerprint(model_path: str) -> str:
+    """A hash identifying a model checkpoint directory.
+
+    Hashes the contents of the (small) JSON config files and the names and sizes of the other
+    files, which is enough to tell checkpoints apart without reading gigabytes of weights.
+    """
+    digest = sha256()
+    for root, _, files in sorted(os.walk(model_path)):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, model_path).encode("utf-8"))
+            if name.endswith(".json"):
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+            else:
+                digest.update(str(os.path.getsize(path)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def backend_identity(tool: str, checkpoint: str = "", params: dict = None) -> str:
+    """The part of the cache key shared by all sentences corrected by one backend configuration."""
+    return "\x1f".join([tool, checkpoint, json.dumps(params or {}, sort_keys=True)])
+
+
+class CorrectionCache:
+    """
+    Attributes:
+        path (str): Path to the SQLite file, created if it does not exist.
+        max_entries (int): Number of entries kept, the least recently used are evicted beyond that.
+        hits (int): Number of sentences found in the cache since it was opened.
+        misses (int): Number of sentences not found in the cache since it was opened.
+    """
+
+    def __init__(self, path: str, max_entries: int = 1_000_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # the backends run in worker threads, access is serialized by the lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS corrections ("
+                "key BLOB PRIMARY KEY, output TEXT, last_used INTEGER)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS corrections_last_used ON corrections (last_used)"
+            )
+        (last_used,) = self._connection.execute(
+            "SELECT COALESCE(MAX(last_used), 0) FROM corrections"
+        ).fetchone()
+        self._clock = last_used
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def keys(self, identity: str, sentences: Iterable[str]) -> List[bytes]:
+        """Get the cache keys of many sentences corrected by the backend with the given identity."""
+        return [
+            sha256("\x1f".join([identity, sentence]).encode("utf-8")).digest()
+            for sentence in sentences
+        ]
+
+    def get_many(self, keys: Iterable[bytes]) -> Dict[bytes, str]:
+        """Look up many keys, and return the corrections of the keys found in the cache."""
+        keys = list(keys)
+        found = {}
+        with self._lock, self._connection:
+            for start in range(0, len(keys), _QUERY_CHUNK_SIZE):
+                chunk = keys[start : start + _QUERY_CHUNK_SIZE]
+                placeholders = ", ".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT key, output FROM corrections WHERE key IN ({placeholders})",
+                    chunk,
+                )
+                found.update(rows)
+                self._connection.execute(
+                    f"UPDATE corrections SET last_used = ? WHERE key IN ({placeholders})",
+                    [self._tick(), *chunk],
+                )
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: Iterable[Tuple[bytes, str]]) -> None:
+        """Store the corrections of many keys, then evict the least recently used beyond the cap."""
+        with self._lock, self._connection:
+            now = self._tick()
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO corrections (key, output, last_used) VALUES (?, ?, ?)",
+                [(key, output, now) for key, output in items],
+            )
+            (count,) = self._connection.execute(
+                "SELECT COUNT(*) FROM corrections"
+            ).fetchone()
+            if count > self.max_entries:
+                self._connection.execute(
+                    "DELETE FROM corrections WHERE key IN ("
+                    "SELECT key FROM corrections ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "CorrectionCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,114 @@
+"""
+Write-ahead journal of generated corrections, so an interrupted generation run can be resumed.
+
+Every corrected sentence is appended to a JSON Lines file as soon as the backend produces it, keyed
+by (tool, example set, rule), and flushed to disk. Each record also holds a hash of the input
+sentence. When the generator starts again, the journal is replayed and only the sentences without
+an entry are corrected. An entry only counts for the sentence it was recorded for, so after a
+benchmark edit the changed sentences are corrected again. A line cut off by a crash is ignored.
+Once a column has been saved to the corrections store its entries are no longer needed, and
+``compact`` rewrites the journal without them.
+"""
+
+import json
+import os
+import threading
+
+from hashlib import sha256
+from typing import Callable, Dict, Optional, Tuple
+
+JournalKey = Tuple[str, int, str]
+
+
+def input_hash(sentence: str) -> str:
+    """The hash of an input sentence stored with its journal entry."""
+    return sha256(sentence.encode("utf-8")).hexdigest()[:16]
+
+
+class CorrectionJournal:
+    def __init__(self, path: str, fsync: bool = True):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        # the input hash and the output of each key
+        self._entries: Dict[JournalKey, Tuple[str, str]] = {}
+        if os.path.exists(path):
+            self._replay()
+        self._file = open(path, "a", encoding="utf-8")
+        if self._file.tell() > 0 and not self._ends_with_newline():
+            # terminate a line cut off by a crash, so the next record starts on its own line
+            self._file.write("\n")
+            self._file.flush()
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _replay(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line of a crashed run may be incomplete
+                    continue
+                if "input_hash" not in record:
+                    # written before the input was hashed, so it cannot be checked
+                    continue
+                key = (record["tool"], record["example_set"], record["rule"])
+                self._entries[key] = (record["input_hash"], record["output"])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: JournalKey, sentence: str) -> Optional[str]:
+        """The output recorded for the key, or None if there is none for this input sentence."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != input_hash(sentence):
+            return None
+        return entry[1]
+
+    def record(self, key: JournalKey, sentence: str, output: str) -> None:
+        """Append the output of the input sentence for the key, replacing any earlier entry."""
+        entry = (input_hash(sentence), output)
+        line = json.dumps(_to_record(key, entry), ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._entries[key] = entry
+
+    def compact(self, keep: Callable[[JournalKey], bool]) -> None:
+        """Rewrite the journal with only the entries for which ``keep`` is true."""
+        with self._lock:
+            self._entries = {key: out for key, out in self._entries.items() if keep(key)}
+            self._file.close()
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for key, entry in self._entries.items():
+                    f.write(json.dumps(_to_record(key, entry), ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "CorrectionJournal":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _to_record(key: JournalKey, entry: Tuple[str, str]) -> dict:
+    tool, example_set, rule = key
+    hashed_input, output = entry
+    return {
+        "tool": tool,
+        "example_set": example_set,
+        "rule": rule,
+        "input_hash": hashed_input,
+        "output": output,
+    }
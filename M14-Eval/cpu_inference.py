@@ -0,0 +1,170 @@
+"""
+CPU inference for the ByT5 correction models.
+
+The transformers pipeline used on the GPU pads every batch to its longest input and generates up to
+a fixed ``max_length``, which makes CPU generation mostly padding-bound. Here the inputs are sorted
+by byte length into buckets, so each batch holds sentences of similar length, the batch size is
+chosen per bucket from a token budget, and the generation length follows the longest input of the
+batch. Results are returned in the original order.
+
+Can also be run on its own to measure the throughput of a checkpoint:
+    python cpu_inference.py path/to/checkpoint sentences.txt [--threads N] [--quantize]
+"""
+
+import argparse
+import time
+
+from dataclasses import dataclass, asdict
+from typing import Callable, List
+
+import torch
+
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+
+@dataclass
+class ThroughputReport:
+    checkpoint: str
+    quantized: bool
+    threads: int
+    sentences: int
+    batches: int
+    seconds: float
+
+    @property
+    def sentences_per_second(self) -> float:
+        return self.sentences / self.seconds if self.seconds else 0.0
+
+    def as_row(self) -> dict:
+        return {
+            **asdict(self),
+            "seconds": round(self.seconds, 2),
+            "sentences/s": round(self.sentences_per_second, 2),
+        }
+
+
+def length_buckets(
+    lengths: List[int], max_tokens_per_batch: int, max_batch_size: int
+) -> List[List[int]]:
+    """Split indices, sorted by length, into batches whose padded size fits the token budget.
+
+    A batch is padded to its longest member, which is the last one since the indices are sorted,
+    so its cost is ``len(batch) * lengths[batch[-1]]``. Short sentences thus get large batches and
+    long sentences small ones. A sentence longer than the budget gets a batch of its own.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches = []
+    batch = []
+    for i in order:
+        if batch and (
+            len(batch) >= max_batch_size
+            or (len(batch) + 1) * lengths[i] > max_tokens_per_batch
+        ):
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class ByT5CPUCorrector:
+    """A ByT5 checkpoint loaded for length-bucketed batched generation on the CPU."""
+
+    def __init__(
+        self,
+        model_path: str,
+        tokenizer: str = "google/byt5-base",
+        num_threads: int = None,
+        quantize: bool = False,
+        max_tokens_per_batch: int = 8192,
+        max_batch_size: int = 64,
+        length_margin: float = 1.2,
+    ):
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.model_path = model_path
+        self.num_threads = torch.get_num_threads()
+        self.quantized = quantize
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.max_batch_size = max_batch_size
+        self.length_margin = length_margin
+
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer)
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_path)
+        model.eval()
+        if quantize:
+            # int8 weights for the linear layers, activations stay in float
+            model = torch.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        self.model = model
+        self.report = None
+
+    def _generation_length(self, input_length: int) -> int:
+        # corrections rarely change the length by much, leave some room for insertions
+        return int(input_length * self.length_margin) + 8
+
+    @torch.inference_mode()
+    def correct(
+        self, sentences: List[str], on_corrected: Callable[[int, str], None] = None
+    ) -> List[str]:
+        """Correct the sentences, calling ``on_corrected(index, output)`` as each batch finishes."""
+        encoded = [self.tokenizer(sentence)["input_ids"] for sentence in sentences]
+        batches = length_buckets(
+            [len(ids) for ids in encoded], self.max_tokens_per_batch, self.max_batch_size
+        )
+
+        corrected = [None] * len(sentences)
+        start = time.perf_counter()
+        for batch in batches:
+            inputs = self.tokenizer.pad(
+                {"input_ids": [encoded[i] for i in batch]}, return_tensors="pt"
+            )
+            outputs = self.model.generate(
+                **inputs,
+                max_length=self._generation_length(inputs["input_ids"].shape[1]),
+            )
+            texts = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+            for i, text in zip(batch, texts):
+                corrected[i] = text
+                if on_corrected is not None:
+                    on_corrected(i, text)
+        self.report = ThroughputReport(
+            checkpoint=self.model_path,
+            quantized=self.quantized,
+            threads=self.num_threads,
+            sentences=len(sentences),
+            batches=len(batches),
+            seconds=time.perf_counter() - start,
+        )
+        return corrected
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the CPU throughput of a ByT5 correction checkpoint."
+    )
+    parser.add_argument("checkpoint", help="Path to the model checkpoint.")
+    parser.add_argument("sentences", help="Text file with one sentence per line.")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--quantize", action="store_true")
+    parser.add_argument("--max_tokens_per_batch", type=int, default=8192)
+    args = parser.parse_args()
+
+    with open(args.sentences, "r") as f:
+        sentences = [line.strip() for line in f if line.strip()]
+
+    corrector = ByT5CPUCorrector(
+        args.checkpoint,
+        num_threads=args.threads,
+        quantize=args.quantize,
+        max_tokens_per_batch=args.max_tokens_per_batch,
+    )
+    corrector.correct(sentences)
+    for key, value in corrector.report.as_row().items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
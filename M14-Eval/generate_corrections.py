@@ -2,17 +2,42 @@ import pandas as pd
 
 import torch
 import yaml
-import requests
 import os
-
-from typing import List, Dict
+import gc
+import asyncio
+import multiprocessing
+import time
+import traceback
+
+from typing import List, Dict, Iterator, Tuple
+from contextlib import contextmanager
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 from datasets import Dataset
-from collections import namedtuple
-from dataclasses import dataclass
+from collections import defaultdict, namedtuple
+from importlib.metadata import version
 from transformers import pipeline
 from transformers.pipelines.pt_utils import KeyDataset
 from tqdm import tqdm
-from tokenizer import split_into_sentences, correct_spaces
+from tokenizer import split_into_sentences
+from icestabs_evaluation.corrections_store import CorrectionsStore
+from correction_backends import (
+    CorrectionBackend,
+    OnCorrected,
+    SchedulingError,
+    create_backend,
+    register_backend,
+    schedule,
+)
+from correction_cache import CorrectionCache, backend_identity, checkpoint_fingerprint
+from correction_journal import CorrectionJournal
+from cpu_inference import ByT5CPUCorrector, ThroughputReport
+from skrambi_client import (
+    SKRAMBI_URL,
+    SkrambiAnnotation,
+    SkrambiClient,
+    apply_skrambi_corrections,
+)
 
 tqdm.pandas()
 
@@ -25,27 +50,55 @@ from evaluation import (
 )
 
 
-def save_corrections(corrections: pd.DataFrame) -> None:
-    corrections.to_csv(
-        os.path.join(CONFIG["FILE_FOLDERS"]["base_dir"], "data", "corrections.tsv"),
-        sep="\t",
-        index=True,
+def corrections_tsv_path() -> str:
+    return os.path.join(
+        CONFIG["FILE_FOLDERS"]["base_dir"], "data", CONFIG["OUTPUT_FILES"]["corrections"]
+    )
+
+
+def open_corrections_store() -> CorrectionsStore:
+    return CorrectionsStore(
+        os.path.join(
+            CONFIG["FILE_FOLDERS"]["base_dir"],
+            "data",
+            CONFIG["OUTPUT_FILES"]["corrections_store"],
+        )
+    )
+
+
+def open_correction_journal() -> CorrectionJournal:
+    return CorrectionJournal(
+        os.path.join(
+            CONFIG["FILE_FOLDERS"]["base_dir"],
+            "data",
+            CONFIG["OUTPUT_FILES"]["correction_journal"],
+        )
+    )
+
+
+def open_correction_cache() -> CorrectionCache:
+    options = CONFIG.get("CORRECTION_CACHE", {})
+    return CorrectionCache(
+        os.path.join(
+            CONFIG["FILE_FOLDERS"]["base_dir"],
+            "data",
+            options.get("path", "correction_cache.sqlite"),
+        ),
+        max_entries=options.get("max_entries", 1_000_000),
     )
 
 
+def save_corrections(store: CorrectionsStore, column_name: str, output: List[str]) -> None:
+    """Write a single tool/example column to the corrections store, without touching the other columns."""
+    store.write_column(column_name, output)
+
+
 def load_config(config_filepath: str) -> dict:
     with open(config_filepath, "r") as f:
         config = yaml.safe_load(f)
     return config
 
 
-def add_output_to_corrections(
-    corrections: pd.DataFrame, output: pd.DataFrame, column_name: str
-) -> pd.DataFrame:
-    corrections[column_name] = output
-    return corrections
-
-
 def join_split_sentences(input: List[str], output: List[str]):
     if len(input) == len(output):
         return output
@@ -97,343 +150,523 @@ def join_split_sentences(input: List[str], output: List[str]):
     return new_output
 
 
-def apply_greynir_correct(example_set: List[str], example_set_index: int) -> List[str]:
-    from reynir_correct import check_errors
+GREYNIR_OPTIONS = {
+    "annotations": False,  # Viljum hafa þetta false hér, því okkur vantar bara textann
+    "format": "text",  # text, json, csv, m2
+    "all_errors": True,  # Viljum allar villur
+    "annotate_unparsed_sentences": True,  # Viljum vita hvaða setningar þáttast ekki
+    "one_sent": True,  # Inntakið hér er að nafninu til ein setning í einu
+}
 
-    all_results = []
+# per-process handle to GreynirCorrect, set up once by _init_greynir_worker
+_greynir_check_errors = None
 
-    options = {
-        "annotations": False,  # Viljum hafa þetta false hér, því okkur vantar bara textann
-        "format": "text",  # text, json, csv, m2
-        "all_errors": True,  # Viljum allar villur
-        "annotate_unparsed_sentences": True,  # Viljum vita hvaða setningar þáttast ekki
-        "one_sent": True,  # Inntakið hér er að nafninu til ein setning í einu
-    }
 
-    tq = tqdm(total=len(example_set), desc="GreynirCorrect", position=0)
-
-    for sent in example_set:
-        # sent = [text.strip().strip("\n") for text in example_set]
-        sent = sent.strip().strip("\n")
-        # Create a new dictionary with all the options and the dynamic text field
-        desc_string = f"Correcting ex_{example_set_index} with GreynirCorrect"
-        updated_options = {**options, "input": sent}
-        result = check_errors(**updated_options)
-        result = result.replace("\n", " ")
-        all_results.append(result)
-        tq.update(1)
-        # results = results.split("\n")
-        # results = join_split_sentences(example_set, results)
-    return all_results
-
-
-@dataclass
-class SkrambiAnnotation:
-    charStart: int
-    charEnd: int
-    targetWord: str
-    suggestions: List[str]
-    errorClass: str
-
-
-def apply_skrambi_corrections(sentences: List[str], annotations):
-    # Initialize the corrected sentences list
-    corrected_sentences = sentences[:]  # A copy of the original sentences
-
-    # Step 1: Process each annotation
-    for annotation in annotations:
-        # Extract annotation details
-        char_start = annotation.charStart
-        char_end = annotation.charEnd
-        target_word = annotation.targetWord
-        suggestions = annotation.suggestions
-
-        # Find out which sentence contains the current annotation based on char_start
-        sentence_index, sentence_start_index = find_sentence_index(
-            sentences, char_start
-        )
-        if sentence_index is None:
-            # print(f"Could not find sentence for annotation: {annotation}")
-            continue
+def _init_greynir_worker() -> None:
+    global _greynir_check_errors
+    from reynir_correct import check_errors
 
-        sentence = corrected_sentences[sentence_index]
-        # print(f"Annotation target word: '{target_word}'")
-        # print(f"Matched sentence: '{sentence}'")
+    _greynir_check_errors = check_errors
+    # parse a throwaway sentence so the grammar and lexicon are loaded once per worker,
+    # not on the first sentence of the example set
+    check_errors(**{**GREYNIR_OPTIONS, "input": "Þetta er setning."})
 
-        # Step 2: Tokenize the sentence into words
-        tokens = " ".join(
-            [sent for sent in split_into_sentences(sentence, normalize=False)]
-        ).split()
 
-        # Step 3: Find the token corresponding to the target word using a simple match
-        for i, token in enumerate(tokens):
-            # Naive matching: If the token matches the target word, replace it with the first suggestion
-            if token == target_word and len(suggestions) > 0:
-                # print(
-                #     f"Replacing '{token}' with '{suggestions[0]}' in sentence {sentence_index}"
-                # )
-                tokens[i] = suggestions[0]  # Replace with the first suggestion
+def _greynir_correct_sentence(sent: str) -> str:
+    sent = sent.strip().strip("\n")
+    result = _greynir_check_errors(**{**GREYNIR_OPTIONS, "input": sent})
+    return result.replace("\n", " ")
 
-        # Step 4: Reassemble the sentence and store the corrected version
-        corrected_sentences[sentence_index] = correct_spaces(" ".join(tokens))
-        # print(f"Corrected sentence: '{corrected_sentences[sentence_index]}'")
-        # print()
 
-    return corrected_sentences
+def apply_greynir_correct(
+    sentences: List[str], workers: int = None, on_corrected: OnCorrected = None
+) -> List[str]:
+    """Correct the sentences with GreynirCorrect, one sentence at a time.
 
+    The sentences are fanned out to a pool of long-lived worker processes,
+    each initializing GreynirCorrect once. ``Executor.map`` keeps the results
+    in input order, so the output is the same as with ``workers=1``, which
+    runs in this process without a pool.
 
-def find_sentence_index(sentences, char_start):
-    """Find the index of the sentence containing the character at char_start"""
-    total_chars = 0  # Cumulative length of sentences
+    This runs in a worker thread of the scheduler, next to model inference
+    threads, and forking a process while other threads hold locks can
+    deadlock the child. The workers are therefore started by a forkserver
+    (or spawned, where there is none) instead of forked from this process.
+    """
+    workers = workers or os.cpu_count() or 1
+    desc = "Correcting with GreynirCorrect"
 
-    for i, sentence in enumerate(sentences):
-        sentence_length = len(sentence) + 1  # +1 for the invisible break '\uefff'
-        if total_chars <= char_start < total_chars + sentence_length:
-            return i, total_chars
-        total_chars += sentence_length
+    corrected = []
 
-    return None, None  # Return None if char_start is out of bounds
+    def collect(results) -> None:
+        for i, result in enumerate(tqdm(results, desc=desc, total=len(sentences))):
+            corrected.append(result)
+            if on_corrected is not None:
+                on_corrected(i, result)
 
+    if workers == 1:
+        _init_greynir_worker()
+        collect(_greynir_correct_sentence(sent) for sent in sentences)
+    else:
+        # a few chunks per worker, to balance the load without a round trip per sentence
+        chunksize = max(1, len(sentences) // (workers * 4))
+        start_method = (
+            "forkserver"
+            if "forkserver" in multiprocessing.get_all_start_methods()
+            else "spawn"
+        )
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_init_greynir_worker,
+        ) as pool:
+            collect(pool.map(_greynir_correct_sentence, sentences, chunksize=chunksize))
+    return corrected
 
-def get_skrambi_correction_bulk(text_list: List[str]):
 
-    url = "https://skrambi.arnastofnun.is/checkDocument"
+def get_skrambi_correction_bulk(text_list: List[str]) -> List[SkrambiAnnotation]:
+    """Annotations for the sentences, with offsets into the sentences joined by one break symbol."""
+    options = CONFIG.get("SKRAMBI", {})
+    with SkrambiClient(
+        url=options.get("url", SKRAMBI_URL),
+        max_chunk_chars=options.get("max_chunk_chars", 20000),
+        concurrency=options.get("concurrency", 4),
+        retries=options.get("retries", 3),
+        timeout=options.get("timeout", 60.0),
+    ) as client:
+        return client.check_sentences(text_list)
 
-    # maintain unicode
-    break_symbol = "\\uefff".encode("utf-8").decode("unicode-escape")
 
-    # Concatenate the entire column values into one payload
-    # payload = f"{break_symbol}".join(text_list)
-    payload = " ".join(text_list)
+def model_checkpoint_path(model_name: str) -> str:
+    model_dir = CONFIG["FILE_FOLDERS"]["model_dir"]
+    if model_name.startswith("ice-gpt-sw3"):
+        return os.path.join(model_dir, "icelandic-gpt-sw3-6.7b-gec")
+    return os.path.join(model_dir, model_name)
 
-    headers = {"Content-Type": "text/plain"}
 
-    # print("Sending request to Skrambi...")
+ICE_GPT_START_PROMPT = "Hér er texti sem ég vil að þú skoðir vel og vandlega. Þú skalt skoða hvert einasta orð, orðasamband, og setningu og meta hvort þér finnist eitthvað athugavert, til dæmis hvað varðar málfræði, stafsetningu, skringilega merkingu og svo framvegis.\nHér er textinn:\n\n"
+ICE_GPT_END_PROMPT = "\n\nReyndu nú að laga textann þannig að hann líti betur út, eins og þér finnst best við hæfi.\n"
 
-    # Send the payload with the entire column's text
-    # add a tqdm loading bar to the request
-    response = requests.post(url, headers=headers, data=payload.encode("utf-8"))
+PROMPT_FIELDS = ["prompt_start", "prompt_end", "line_start", "line_end"]
 
-    # Parse the response, assuming it's a list of annotations for the concatenated text
-    annotations: List[SkrambiAnnotation] = [
-        SkrambiAnnotation(**ann) for ann in response.json()
-    ]
 
-    return annotations
+def generation_params(model_name: str, max_length: int = None) -> dict:
+    """The pipeline arguments and prompt of a model, all its outputs depend on but the weights."""
+    if model_name.startswith("byt5"):
+        return {
+            "task": "text2text-generation",
+            "tokenizer": "google/byt5-base",
+            "batch_size": 8,
+            "max_length": max_length,
+            "prompt_start": "",
+            "prompt_end": "",
+            "line_start": "",
+            "line_end": "",
+        }
+    if model_name.startswith("ice-gpt-sw3"):
+        return {
+            "task": "text-generation",
+            "tokenizer": "AI-Sweden-Models/gpt-sw3-6.7b",
+            "max_new_tokens": 1024,
+            "return_full_text": False,
+            "prompt_start": ICE_GPT_START_PROMPT,
+            "prompt_end": ICE_GPT_END_PROMPT,
+            "line_start": '"\n',
+            "line_end": '\n\n"',
+        }
+    raise ValueError(f"Model '{model_name}' not found.")
 
 
 def load_model(model_name: str, max_length: int = None) -> pipeline:
-    model_dir = CONFIG["FILE_FOLDERS"]["model_dir"]
-    corr = namedtuple(
-        "correction",
-        ["pipe", "prompt_start", "prompt_end", "line_start", "line_end"],
-    )
+    corr = namedtuple("correction", ["pipe", *PROMPT_FIELDS])
+    params = generation_params(model_name, max_length)
+    prompt = {field: params.pop(field) for field in PROMPT_FIELDS}
     if model_name.startswith("byt5"):
-        model_path = os.path.join(model_dir, model_name)
-        device = 0
-        pipe = pipeline(
-            "text2text-generation",
-            model=model_path,
-            tokenizer="google/byt5-base",
-            device=device,  # use the GPU (0) or CPU (-1)
-            batch_size=8,
-            max_length=max_length,
-        )
-        return corr(pipe, "", "", "", "")
-    if model_name.startswith("ice-gpt-sw3"):
-        START_PROMPT = "Hér er texti sem ég vil að þú skoðir vel og vandlega. Þú skalt skoða hvert einasta orð, orðasamband, og setningu og meta hvort þér finnist eitthvað athugavert, til dæmis hvað varðar málfræði, stafsetningu, skringilega merkingu og svo framvegis.\nHér er textinn:\n\n"
-        END_PROMPT = "\n\nReyndu nú að laga textann þannig að hann líti betur út, eins og þér finnst best við hæfi.\n"
-        pipe = pipeline(
-            "text-generation",
-            model=os.path.join(model_dir, "icelandic-gpt-sw3-6.7b-gec"),
-            max_new_tokens=1024,
-            device_map="auto",
-            tokenizer="AI-Sweden-Models/gpt-sw3-6.7b",
-            return_full_text=False,
-        )
-        # return a named tuple
-
-        return corr(pipe, START_PROMPT, END_PROMPT, '"\n', '\n\n"')
+        # use the GPU (0) or CPU (-1)
+        device = {"device": 0}
     else:
-        raise ValueError(f"Model '{model_name}' not found.")
+        device = {"device_map": "auto"}
+    pipe = pipeline(model=model_checkpoint_path(model_name), **device, **params)
+    return corr(pipe, **prompt)
 
 
-def apply_correction_model(
-    model_name: str,
-    example_set: List[str],
-    example_set_index: int = None,
-    max_length: int = None,
-) -> str:
+@contextmanager
+def loaded_model(model_name: str, max_length: int = None) -> Iterator[tuple]:
+    """Load a correction model for the duration of a with-block.
 
-    total_length = len(example_set)
+    The pipeline is released as soon as the block exits: the reference held
+    here is dropped and collected before the CUDA cache is emptied, so the next
+    model starts from a clean device. Callers should ``del`` their own handle
+    before leaving the block, otherwise the model outlives it.
+    """
     correction = load_model(model_name, max_length=max_length)
-    example_set = [
-        f"{correction.prompt_start}{ex}{correction.prompt_end}" for ex in example_set
-    ]
-    example_set_name = f"ex_{example_set_index}" if example_set_index else "example_set"
-    example_set = {example_set_name: example_set}
+    try:
+        yield correction
+    finally:
+        del correction
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+def use_cpu_inference(model_name: str) -> bool:
+    inference = CONFIG.get("INFERENCE", {})
+    return model_name.startswith("byt5") and inference.get("device") == "cpu"
+
+
+def cpu_inference_options(inference: dict) -> dict:
+    """The options of the CPU backend that its outputs depend on, from the INFERENCE config."""
+    return {
+        "quantize": inference.get("quantize", False),
+        "max_tokens_per_batch": inference.get("max_tokens_per_batch", 8192),
+        "max_batch_size": inference.get("max_batch_size", 64),
+        "length_margin": inference.get("length_margin", 1.2),
+    }
 
-    dataset = Dataset.from_dict(example_set)
 
-    corrected = tqdm(
-        correction.pipe(KeyDataset(dataset, key=example_set_name)),
-        desc=f"Correcting {example_set_name} with {model_name}",
-        total=total_length,
+def apply_byt5_cpu(
+    model_name: str, sentences: List[str], on_corrected: OnCorrected = None
+) -> Tuple[List[str], ThroughputReport]:
+    """Correct the sentences with a ByT5 checkpoint using the bucketed CPU backend."""
+    inference = CONFIG.get("INFERENCE", {})
+    corrector = ByT5CPUCorrector(
+        model_checkpoint_path(model_name),
+        num_threads=inference.get("num_threads"),
+        **cpu_inference_options(inference),
     )
-    # due to the batch size being n, the corrected is list of 245/n nested lists
-    # we need to flatten the list
-    corrected = [out[0]["generated_text"] for out in corrected]
-    line_start, line_end = correction.line_start, correction.line_end
-    corrected = [
-        out.strip().strip(line_start).strip(line_end).strip() for out in corrected
-    ]
+    try:
+        print(f"Correcting {len(sentences)} sentences with {model_name} on CPU")
+        corrected = corrector.correct(
+            sentences,
+            on_corrected and (lambda i, out: on_corrected(i, out.strip())),
+        )
+        report = corrector.report
+        report.checkpoint = model_name
+    finally:
+        del corrector
+        gc.collect()
+    corrected = [out.strip() for out in corrected]
+    return corrected, report
 
-    # free the memory used by the correction_pipe
-    with torch.no_grad():
-        correction_pipe = None
-        torch.cuda.empty_cache()
+
+def apply_correction_model(
+    model_name: str,
+    sentences: List[str],
+    max_length: int = None,
+    on_corrected: OnCorrected = None,
+) -> List[str]:
+    """Correct the sentences with one load of the model, in a single batched pass."""
+
+    with loaded_model(model_name, max_length=max_length) as correction:
+        prompts = [
+            f"{correction.prompt_start}{ex}{correction.prompt_end}" for ex in sentences
+        ]
+        dataset = Dataset.from_dict({"text": prompts})
+
+        outputs = tqdm(
+            correction.pipe(KeyDataset(dataset, key="text")),
+            desc=f"Correcting with {model_name}",
+            total=len(sentences),
+        )
+        line_start, line_end = correction.line_start, correction.line_end
+        corrected = []
+        # due to the batch size being n, the corrected is list of 245/n nested lists
+        # we need to flatten the list
+        for i, out in enumerate(outputs):
+            out = out[0]["generated_text"].strip().strip(line_start).strip(line_end).strip()
+            corrected.append(out)
+            if on_corrected is not None:
+                on_corrected(i, out)
+        # drop our references so the pipeline can be freed when the block exits
+        del outputs, correction
 
     return corrected
 
 
-def initiate_corrections(overwrite: bool = False) -> pd.DataFrame:
+def missing_example_sets(
+    corrections: CorrectionsStore, tool: str
+) -> Dict[int, List[str]]:
+    """The original example sets that have no column for the tool in the store yet."""
+    missing_sets = {}
+    for i in range(1, 4):
+        column_name = f"ex_{i}_{tool}"
+        if column_name in corrections:
+            print(f"Column {column_name} already exists in data. Skipping...")
+            continue
+        missing_sets[i] = get_original_set(i)
+    return missing_sets
+
+
+@register_backend("byt5-22-09", "byt5-23-12", "byt5-24-03", "ice-gpt-sw3")
+class ModelBackend(CorrectionBackend):
+    """The neural correction models, on the GPU pipeline or the CPU backend."""
+
+    resource = "gpu"
+
+    def __init__(self, tool: str, config: dict):
+        super().__init__(tool, config)
+        self.report = None
+        if use_cpu_inference(tool):
+            self.resource = "cpu"
+
+    def max_length(self) -> int:
+        """The generation max_length, the length of the longest original sentence of the benchmark.
+
+        It is taken over the whole benchmark rather than the sentences of the batch, so the output
+        of a sentence does not depend on which other sentences were found in the cache.
+        """
+        return max(len(ex) for i in range(1, 4) for ex in get_original_set(i))
+
+    def correct_batch(
+        self, sentences: List[str], on_corrected: OnCorrected = None
+    ) -> List[str]:
+        if use_cpu_inference(self.tool):
+            corrected, self.report = apply_byt5_cpu(self.tool, sentences, on_corrected)
+            return corrected
+        return apply_correction_model(
+            self.tool, sentences, self.max_length(), on_corrected
+        )
+
+    def identity(self) -> str:
+        if use_cpu_inference(self.tool):
+            params = {
+                "device": "cpu",
+                **cpu_inference_options(self.config.get("INFERENCE", {})),
+            }
+        else:
+            params = {"device": "gpu", **generation_params(self.tool, self.max_length())}
+        return backend_identity(
+            self.tool, checkpoint_fingerprint(model_checkpoint_path(self.tool)), params
+        )
+
+
+@register_backend("greynir")
+class GreynirBackend(CorrectionBackend):
+    resource = "cpu"
+
+    def correct_batch(
+        self, sentences: List[str], on_corrected: OnCorrected = None
+    ) -> List[str]:
+        workers = self.config.get("INFERENCE", {}).get("greynir_workers")
+        return apply_greynir_correct(sentences, workers, on_corrected)
+
+    def identity(self) -> str:
+        return backend_identity(self.tool, version("reynir-correct"), GREYNIR_OPTIONS)
+
+
+@register_backend("skrambi")
+class SkrambiBackend(CorrectionBackend):
+    resource = "network"
+
+    async def correct_batch(
+        self, sentences: List[str], on_corrected: OnCorrected = None
+    ) -> List[str]:
+        annotations = await asyncio.to_thread(get_skrambi_correction_bulk, sentences)
+        return apply_skrambi_corrections(sentences, annotations)
+
+    def identity(self) -> str:
+        """The URL of the service and the current cache period.
+
+        The service does not report a version, so its corrections are only reused for
+        SKRAMBI.cache_expiry_days days, after which the identity changes.
+        """
+        options = self.config.get("SKRAMBI", {})
+        expiry_days = options.get("cache_expiry_days", 7)
+        return backend_identity(
+            self.tool,
+            options.get("url", SKRAMBI_URL),
+            {
+                "max_chunk_chars": options.get("max_chunk_chars", 20000),
+                "period": int(time.time() // (expiry_days * 24 * 60 * 60)),
+            },
+        )
+
+
+class ManualBackend(CorrectionBackend):
+    """Outputs of tools that were run by hand, read from data/output_manual."""
+
+    resource = "io"
+    journaled = False
+
+    async def correct_example_sets(
+        self, example_sets: Dict[int, List[str]], on_corrected: OnCorrected = None
+    ) -> Dict[int, List[str]]:
+        manual_dir_path = os.path.join(
+            self.config["FILE_FOLDERS"]["base_dir"], "data", "output_manual"
+        )
+        corrected_sets = {}
+        for i in example_sets:
+            manual_file_path = os.path.join(manual_dir_path, f"ex_{i}_{self.tool}.txt")
+            with open(manual_file_path, "r") as f:
+                lines = [line.strip() for line in f.readlines()]
+                corrected_sets[i] = [line for line in lines if line]
+        return corrected_sets
+
+
+async def run_backend(
+    corrections: CorrectionsStore,
+    backend: CorrectionBackend,
+    example_sets: Dict[int, List[str]],
+    journal: CorrectionJournal,
+    cache: CorrectionCache,
+) -> None:
+    """Correct the example sets with the backend and save a column per set.
+
+    Every corrected sentence is checkpointed in the journal as soon as the
+    backend produces it, keyed by (tool, example set, rule) and checked
+    against a hash of the sentence, and sentences already in the journal
+    from an interrupted run are not corrected again.
+    Of the rest, sentences found in the correction cache are not corrected
+    either, and each distinct sentence is only sent to the backend once.
+    """
+    if not backend.journaled:
+        corrected_sets = await backend.correct_example_sets(example_sets)
+        for i, corrected in corrected_sets.items():
+            save_corrections(corrections, f"ex_{i}_{backend.tool}", corrected)
+        return
+
+    keys = {
+        i: [(backend.tool, i, rule) for rule in rule_classes] for i in example_sets
+    }
+    # the journal keys of every sentence that still needs a correction
+    pending = defaultdict(list)
+    for i, example_set in example_sets.items():
+        for key, sent in zip(keys[i], example_set):
+            if journal.get(key, sent) is None:
+                pending[sent].append(key)
+    total = sum(len(example_set) for example_set in example_sets.values())
+    resumed = total - sum(len(sent_keys) for sent_keys in pending.values())
+    if resumed:
+        print(f"Resuming {backend.tool}: {resumed} sentences already in the journal")
+
+    identity = backend.identity()
+    if pending and identity is not None:
+        cache_keys = dict(zip(pending, cache.keys(identity, pending)))
+        found = cache.get_many(cache_keys.values())
+        for sent in list(pending):
+            if cache_keys[sent] in found:
+                for key in pending.pop(sent):
+                    journal.record(key, sent, found[cache_keys[sent]])
+        if found:
+            print(f"Found {len(found)} {backend.tool} corrections in the cache")
+
+    if pending:
+        sentences = list(pending)
+
+        def record(index: int, output: str) -> None:
+            for key in pending[sentences[index]]:
+                journal.record(key, sentences[index], output)
+
+        corrected = await backend.correct(sentences, record)
+        # backends that don't report sentences as they go are checkpointed at the end
+        for sent, output in zip(sentences, corrected):
+            for key in pending[sent]:
+                if journal.get(key, sent) is None:
+                    journal.record(key, sent, output)
+        if identity is not None:
+            cache.put_many(zip(cache.keys(identity, sentences), corrected))
+
+    for i in example_sets:
+        save_corrections(
+            corrections,
+            f"ex_{i}_{backend.tool}",
+            [journal.get(key, sent) for key, sent in zip(keys[i], example_sets[i])],
+        )
+
+
+BASE_COLUMNS = [
+    "rule",
+    "ex_1_standardized",
+    "ex_2_standardized",
+    "ex_3_standardized",
+    "ex_1_original",
+    "ex_2_original",
+    "ex_3_original",
+]
+
+
+def write_base_columns(store: CorrectionsStore) -> None:
+    store.write_column("rule", rule_classes)
+    for i in range(1, 4):
+        store.write_column(f"ex_{i}_standardized", get_standardized_set(i))
+    for i in range(1, 4):
+        store.write_column(f"ex_{i}_original", get_original_set(i))
+
+
+def initiate_corrections(overwrite: bool = False) -> CorrectionsStore:
+    store = open_corrections_store()
     if overwrite:
         if isinstance(overwrite, bool):
-            corrections = pd.DataFrame(
-                columns=[
-                    "rule",
-                    "ex_1_standardized",
-                    "ex_2_standardized",
-                    "ex_3_standardized",
-                    "ex_1_original",
-                    "ex_2_original",
-                    "ex_3_original",
-                ]
-            )
-
-            corrections["rule"] = rule_classes
-            for i in range(1, 4):
-                corrections[f"ex_{i}_standardized"] = get_standardized_set(i)
-                corrections[f"ex_{i}_original"] = get_original_set(i)
+            for column_name in store.columns:
+                store.drop_column(column_name)
         elif isinstance(overwrite, list):
             # If a list of tools is provided, overwrite only those columns
-            corrections = pd.read_csv(
-                os.path.join(
-                    CONFIG["FILE_FOLDERS"]["base_dir"], "data", "corrections.tsv"
-                ),
-                sep="\t",
-            )
-            if "Unnamed: 0" in corrections.columns:
-                corrections = corrections.drop(columns=["Unnamed: 0"])
             for tool in overwrite:
                 if tool not in CONFIG["GLOBALS"]["tools"]:
                     print(f"Tool {tool} not found. Skipping...")
                     continue
                 for i in range(1, 4):
-                    column_name = f"ex_{i}_{tool}"
-                    if column_name in corrections.columns:
-                        corrections = corrections.drop(columns=[column_name])
-    else:
-        CORRECTIONS_PATH = os.path.join(
-            CONFIG["FILE_FOLDERS"]["base_dir"], "data", "corrections.tsv"
+                    store.drop_column(f"ex_{i}_{tool}")
+    elif not store.columns and os.path.exists(corrections_tsv_path()):
+        # migrate the corrections of an earlier run from the TSV file, once
+        corrections = pd.read_csv(corrections_tsv_path(), sep="\t")
+        CorrectionsStore.from_dataframe(store.path, corrections)
+        store = open_corrections_store()
+    if not all(column_name in store for column_name in BASE_COLUMNS):
+        write_base_columns(store)
+    return store
+
+
+def apply_all_corrections(corrections: CorrectionsStore, tools: Dict[str, dict]) -> None:
+    """Fill the missing columns of every tool, running the backends on different resources concurrently."""
+    backends = {}
+    jobs = {}
+    journal = open_correction_journal()
+    cache = open_correction_cache()
+    for tool in tools:
+        fallback = (
+            ManualBackend if tool in CONFIG["GLOBALS"]["manual_tools"] else None
+        )
+        backend = create_backend(tool, CONFIG, fallback)
+        if backend is None:
+            print(f"Tool {tool} not found. Skipping...")
+            continue
+        missing_sets = missing_example_sets(corrections, tool)
+        if not missing_sets:
+            continue
+        backends[tool] = backend
+        jobs[tool] = partial(
+            run_backend, corrections, backend, missing_sets, journal, cache
         )
-        if os.path.exists(CORRECTIONS_PATH):
-            corrections = pd.read_csv(CORRECTIONS_PATH, sep="\t")
-            if "Unnamed: 0" in corrections.columns:
-                corrections = corrections.drop(columns=["Unnamed: 0"])
-        else:
-            corrections = pd.DataFrame(
-                columns=[
-                    "rule",
-                    "ex_1_standardized",
-                    "ex_2_standardized",
-                    "ex_3_standardized",
-                    "ex_1_original",
-                    "ex_2_original",
-                    "ex_3_original",
-                ]
-            )
-
-            corrections["rule"] = rule_classes
-            for i in range(1, 4):
-                corrections[f"ex_{i}_standardized"] = get_standardized_set(i)
-                corrections[f"ex_{i}_original"] = get_original_set(i)
-    return corrections
-
 
-def apply_all_corrections(corrections: pd.DataFrame, tools: Dict[str, dict]) -> None:
-    for tool in tools:
-        for i in range(1, 4):
-            example_set = get_original_set(i)
-            max_length = max([len(ex) for ex in example_set])
-            match tool:
-                case "greynir":
-                    column_name = f"ex_{i}_greynir"
-                    if not column_name in corrections.columns:
-                        greynir_corrected = apply_greynir_correct(example_set, i)
-                        add_output_to_corrections(
-                            corrections, greynir_corrected, f"ex_{i}_greynir"
-                        )
-                        save_corrections(corrections)
-                    else:
-                        print(f"Column {column_name} already exists in data. Skipping")
-                case tool if tool in ["byt5-22-09", "byt5-23-12", "byt5-24-03"]:
-
-                    column_name = f"ex_{i}_{tool}"
-                    if column_name in corrections.columns:
-                        print(
-                            f"Column {column_name} already exists in data. Skipping..."
-                        )
-                        continue
-                    byt_5_corrected = apply_correction_model(
-                        tool, example_set, i, max_length
-                    )
-                    add_output_to_corrections(corrections, byt_5_corrected, column_name)
-                    save_corrections(corrections)
-                case "skrambi":
-                    column_name = f"ex_{i}_skrambi"
-                    if not column_name in corrections.columns:
-                        print(f"Applying Skrambi corrections to ex_{i}")
-                        annotations = get_skrambi_correction_bulk(example_set)
-                        corrected = apply_skrambi_corrections(example_set, annotations)
-                        corrections = add_output_to_corrections(
-                            corrections, corrected, column_name
-                        )
-                        save_corrections(corrections)
-                    else:
-                        print(f"Column {column_name} already exists in data. Skipping")
-
-                case "ice-gpt-sw3":
-                    column_name = f"ex_{i}_ice-gpt-sw3"
-                    if not column_name in corrections.columns:
-                        gpt_corrected = apply_correction_model(
-                            "ice-gpt-sw3", example_set, i, max_length
-                        )
-                        add_output_to_corrections(
-                            corrections, gpt_corrected, column_name
-                        )
-                        save_corrections(corrections)
-                    else:
-                        print(
-                            f"Column {column_name} already exists in data. Skipping..."
-                        )
-                case tool if tool in CONFIG["GLOBALS"]["manual_tools"]:
-                    column_name = f"ex_{i}_{tool}"
-                    manual_dir_path = os.path.join(
-                        CONFIG["FILE_FOLDERS"]["base_dir"], "data", "output_manual"
-                    )
-                    manual_file_path = os.path.join(
-                        manual_dir_path, f"{column_name}.txt"
-                    )
-                    with open(manual_file_path, "r") as f:
-                        lines = f.readlines()
-                        lines = [line.strip() for line in lines]
-                        lines = [line for line in lines if line]
-
-                        add_output_to_corrections(corrections, lines, column_name)
-                        save_corrections(corrections)
-                case _:
-                    print(f"Tool {tool} not found. Skipping...")
+    with journal, cache:
+        try:
+            asyncio.run(
+                schedule(
+                    jobs, {tool: backend.resource for tool, backend in backends.items()}
+                )
+            )
+        except SchedulingError as error:
+            for tool, failure in error.failures.items():
+                print(f"Correcting with {tool} failed:")
+                traceback.print_exception(failure)
+            raise
+        finally:
+            # entries of columns that made it into the store are no longer needed
+            journal.compact(lambda key: f"ex_{key[1]}_{key[0]}" not in corrections)
+
+    throughput_reports = [
+        backend.report
+        for backend in backends.values()
+        if getattr(backend, "report", None) is not None
+    ]
+    if throughput_reports:
+        print("CPU inference throughput:")
+        print(
+            pd.DataFrame([report.as_row() for report in throughput_reports]).to_string(
+                index=False
+            )
+        )
 
 
 def main():
@@ -443,8 +676,9 @@ def main():
     base_dir = CONFIG["FILE_FOLDERS"]["base_dir"]
 
     corrections = initiate_corrections(overwrite=False)
-    save_corrections(corrections)
     apply_all_corrections(corrections, TOOLS)
+    # export the store once at the end, for the tools that read the TSV file
+    corrections.to_tsv(corrections_tsv_path())
 
 
 if __name__ == "__main__":
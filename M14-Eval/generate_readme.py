@@ -1,13 +1,9 @@
 from pandas import DataFrame
 from typing import Dict
 from datetime import datetime
-from icestabs_evaluation import load_config_yaml, data_from_tsv, build_overview_data
-from icestabs_evaluation.statistics import (
-    generate_summary_table,
-    generate_per_rule_table,
-    leaderboard_from_per_rule_table,
-    f_score_per_tool,
-)
+from icestabs_evaluation import load_config_yaml
+from icestabs_evaluation.pipeline import evaluate_corrections, load_config_corrections
+from icestabs_evaluation.score_cache import ScoreCache
 
 
 MD_TEMPLATE = """
@@ -142,13 +138,15 @@ if __name__ == "__main__":
         "word": "ms_word",
         "puki": "puki",
     }
-    data = data_from_tsv("data/corrections.tsv")
-    overview = build_overview_data(data)
-    # print the first row
-    summary_table = generate_summary_table(overview)
-    per_rule = generate_per_rule_table(overview)
-    leaderboard = leaderboard_from_per_rule_table(per_rule)
-    f1_scores = f_score_per_tool(overview)
+    data = load_config_corrections(eval_config, "M14-eval-config.yml")
+    # score all the tools in a single pass, and derive all the tables from it.
+    # only the cells that are new or changed since the last run are scored
+    with ScoreCache("data/score_cache.sqlite") as score_cache:
+        tables = evaluate_corrections(data, score_cache=score_cache)
+    summary_table = tables.summary
+    per_rule = tables.per_rule
+    leaderboard = tables.leaderboard
+    f1_scores = tables.f1_scores
 
     f1_scores = f1_scores.rename(
         columns={
@@ -0,0 +1,101 @@
+"""
+A local stand-in for the Skrambi ``checkDocument`` endpoint, for running the Skrambi path offline.
+
+It flags the words found in a small table of misspellings and answers with annotations in the
+format of the real service. It can also fail every n-th request with a 503, to exercise the retries
+of the client.
+
+Usage:
+    python mock_skrambi.py [--port 8765] [--fail_every N]
+
+or from Python:
+    server, url = start_mock_server()
+    ...
+    server.shutdown()
+"""
+
+import argparse
+import json
+import re
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+
+MISSPELLINGS = {
+    "hunt": "hund",
+    "seigja": "segja",
+    "vilaus": "villulaus",
+    "eftilvill": "ef til vill",
+    "alldrei": "aldrei",
+}
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def check_document(text: str, misspellings: Dict[str, str] = MISSPELLINGS) -> list:
+    return [
+        {
+            "charStart": match.start(),
+            "charEnd": match.end(),
+            "targetWord": match.group(),
+            "suggestions": [misspellings[match.group()]],
+            "errorClass": "spelling",
+        }
+        for match in WORD_PATTERN.finditer(text)
+        if match.group() in misspellings
+    ]
+
+
+class MockSkrambiHandler(BaseHTTPRequestHandler):
+    fail_every = 0
+    requests_served = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        if self.path != "/checkDocument":
+            self.send_error(404)
+            return
+        with self.lock:
+            type(self).requests_served += 1
+            should_fail = self.fail_every and self.requests_served % self.fail_every == 0
+        length = int(self.headers.get("Content-Length", 0))
+        text = self.rfile.read(length).decode("utf-8")
+        if should_fail:
+            self.send_error(503)
+            return
+        body = json.dumps(check_document(text)).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_server(
+    port: int = 0, fail_every: int = 0
+) -> Tuple[ThreadingHTTPServer, str]:
+    """Serve the mock in a background thread, returns the server and its checkDocument url."""
+    handler = type("Handler", (MockSkrambiHandler,), {"fail_every": fail_every})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/checkDocument"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock Skrambi server.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail_every", type=int, default=0)
+    args = parser.parse_args()
+
+    handler = type("Handler", (MockSkrambiHandler,), {"fail_every": args.fail_every})
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), handler)
+    print(f"Mock Skrambi listening on http://127.0.0.1:{args.port}/checkDocument")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
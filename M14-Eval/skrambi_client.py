@@ -0,0 +1,214 @@
+"""
+Client for the Skrambi ``checkDocument`` endpoint.
+
+Large inputs are split into chunks of whole sentences bounded by a character budget. The chunks are
+sent concurrently over one pooled HTTP session, failed requests are retried with exponential
+backoff, and the annotation offsets of each chunk are shifted back into the coordinates of the full
+document, i.e. the sentences joined by ``SENTENCE_BREAK``. ``apply_skrambi_corrections`` then
+replaces the annotated words of the sentences with the first suggestion.
+"""
+
+import time
+
+from bisect import bisect_right
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+SKRAMBI_URL = "https://skrambi.arnastofnun.is/checkDocument"
+
+# one character, so sentence offsets are the prefix sums of the sentence lengths plus one
+SENTENCE_BREAK = "\uefff"
+
+# statuses worth retrying, anything else is raised straight away
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class SkrambiAnnotation:
+    charStart: int
+    charEnd: int
+    targetWord: str
+    suggestions: List[str]
+    errorClass: str
+
+
+class SentenceOffsetIndex:
+    """Maps character offsets in the joined document back to sentences.
+
+    The document sent to Skrambi is the sentences joined by a one character
+    separator, so sentence ``i`` starts at the prefix sum of the lengths of
+    the sentences before it (plus separators). A lookup is a bisect on those
+    start offsets instead of a scan over all sentences.
+    """
+
+    def __init__(self, sentences: List[str], separator_length: int = 1):
+        self.starts = list(
+            accumulate(
+                (len(sentence) + separator_length for sentence in sentences),
+                initial=0,
+            )
+        )
+        self.num_sentences = len(sentences)
+
+    def locate(self, char_start: int) -> Optional[Tuple[int, int]]:
+        """The sentence containing ``char_start`` and the offset within it, or None if out of bounds."""
+        sentence_index = bisect_right(self.starts, char_start) - 1
+        if sentence_index < 0 or sentence_index >= self.num_sentences:
+            return None
+        return sentence_index, char_start - self.starts[sentence_index]
+
+
+def chunk_sentences(sentences: List[str], max_chunk_chars: int) -> List[Tuple[int, int]]:
+    """Split the sentences into (start, end) index ranges whose joined text fits the budget.
+
+    A sentence longer than the budget gets a chunk of its own, sentences are never split.
+    """
+    chunks = []
+    start = 0
+    chunk_chars = 0
+    for i, sentence in enumerate(sentences):
+        sentence_chars = len(sentence) + len(SENTENCE_BREAK)
+        if i > start and chunk_chars + sentence_chars > max_chunk_chars:
+            chunks.append((start, i))
+            start = i
+            chunk_chars = 0
+        chunk_chars += sentence_chars
+    if start < len(sentences):
+        chunks.append((start, len(sentences)))
+    return chunks
+
+
+class SkrambiClient:
+    def __init__(
+        self,
+        url: str = SKRAMBI_URL,
+        max_chunk_chars: int = 20000,
+        concurrency: int = 4,
+        retries: int = 3,
+        backoff: float = 0.5,
+        timeout: float = 60.0,
+    ):
+        self.url = url
+        self.max_chunk_chars = max_chunk_chars
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self) -> "SkrambiClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def check_document(self, text: str) -> List[SkrambiAnnotation]:
+        """Send a single document, retrying connection errors and retryable statuses."""
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.post(
+                    self.url,
+                    headers={"Content-Type": "text/plain"},
+                    data=text.encode("utf-8"),
+                    timeout=self.timeout,
+                )
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return [SkrambiAnnotation(**ann) for ann in response.json()]
+                error = requests.HTTPError(
+                    f"Skrambi returned {response.status_code}", response=response
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2**attempt)
+        raise error
+
+    def check_sentences(self, sentences: List[str]) -> List[SkrambiAnnotation]:
+        """Annotations for the sentences, with offsets into the sentences joined by ``SENTENCE_BREAK``."""
+        offsets = SentenceOffsetIndex(sentences, len(SENTENCE_BREAK)).starts
+        chunks = chunk_sentences(sentences, self.max_chunk_chars)
+
+        def check_chunk(chunk: Tuple[int, int]) -> List[SkrambiAnnotation]:
+            start, end = chunk
+            annotations = self.check_document(SENTENCE_BREAK.join(sentences[start:end]))
+            for annotation in annotations:
+                annotation.charStart += offsets[start]
+                annotation.charEnd += offsets[start]
+            return annotations
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            # map keeps the chunk order, so the annotations stay sorted by offset
+            return [
+                annotation
+                for annotations in pool.map(check_chunk, chunks)
+                for annotation in annotations
+            ]
+
+
+def group_annotations(
+    sentences: List[str], annotations: List[SkrambiAnnotation]
+) -> Dict[int, List[Tuple[int, int, str, str]]]:
+    """Group the annotations with a suggestion into (start, end, target, replacement) spans per sentence."""
+    index = SentenceOffsetIndex(sentences)
+    spans = defaultdict(list)
+    for annotation in annotations:
+        if not annotation.suggestions:
+            continue
+        location = index.locate(annotation.charStart)
+        if location is None:
+            continue
+        sentence_index, start = location
+        end = start + len(annotation.targetWord)
+        spans[sentence_index].append(
+            (start, end, annotation.targetWord, annotation.suggestions[0])
+        )
+    return spans
+
+
+def apply_skrambi_corrections(
+    sentences: List[str], annotations: List[SkrambiAnnotation]
+) -> List[str]:
+    """Replace each annotated span with its first suggestion.
+
+    Only the annotated occurrence of a word is replaced, not every token equal
+    to it in the sentence. Spans whose text does not match the annotation's
+    target word (e.g. because of drifting offsets) and spans overlapping an
+    earlier one are skipped.
+    """
+    corrected_sentences = sentences[:]  # A copy of the original sentences
+    skipped = 0
+    for sentence_index, sentence_spans in group_annotations(
+        sentences, annotations
+    ).items():
+        sentence = sentences[sentence_index]
+        pieces = []
+        position = 0
+        for start, end, target_word, replacement in sorted(sentence_spans):
+            if start < position:
+                skipped += 1
+                continue
+            if sentence[start:end] != target_word:
+                skipped += 1
+                continue
+            pieces.append(sentence[position:start])
+            pieces.append(replacement)
+            position = end
+        pieces.append(sentence[position:])
+        corrected_sentences[sentence_index] = "".join(pieces)
+    if skipped:
+        print(f"Skipped {skipped} Skrambi annotations that did not match the text")
+    return corrected_sentences
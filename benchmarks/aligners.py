@@ -0,0 +1,87 @@
+"""
+Benchmark of the token alignment backends on long tool outputs.
+
+Simulates outputs that ramble past the reference (as e.g. the ice-gpt-sw3 outputs sometimes do),
+by appending text to the original sentences of the corrections file, and times the alignment of
+the original tokens to the output tokens with each aligner. Two kinds of rambling are simulated:
+appending other benchmark sentences, and repeating the (slightly edited) sentence itself, which
+is the worst case for SequenceMatcher. Along with the time, the total number of edit operations
+(non-matching pairs) in the alignments is reported, as a measure of alignment quality.
+
+Usage:
+    python benchmarks/aligners.py [path/to/corrections.tsv] [--repeat N]
+"""
+
+import argparse
+import random
+import time
+
+from itertools import product
+
+from icestabs_evaluation import data_from_tsv
+from icestabs_evaluation.token_level_eval import ALIGNERS, tokenize_text
+
+
+def build_cases(
+    corrections_path: str, ramble_sentences: int, repeat_self: bool, seed: int = 0
+):
+    corrections = data_from_tsv(corrections_path)
+    sentences = corrections["ex_1_original"].tolist()
+    rng = random.Random(seed)
+    cases = []
+    for sentence in sentences:
+        input_tokens = tokenize_text(sentence)
+        output_tokens = list(input_tokens)
+        # a few token edits, followed by a long rambling continuation
+        for _ in range(2):
+            if output_tokens:
+                output_tokens[rng.randrange(len(output_tokens))] = "xxx"
+        rambling = list(output_tokens)
+        for _ in range(ramble_sentences):
+            if repeat_self:
+                output_tokens.extend(rambling)
+            else:
+                output_tokens.extend(tokenize_text(rng.choice(sentences)))
+        cases.append((input_tokens, output_tokens))
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "corrections", nargs="?", default="M14-Eval/data/corrections.tsv"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        f"| rambling | ramble sentences | mean output tokens | {' | '.join(ALIGNERS)} |"
+    )
+    print(f"|---|---|---|{'---|' * len(ALIGNERS)}")
+    for repeat_self, ramble_sentences in product((False, True), (0, 5, 20, 50)):
+        cases = build_cases(args.corrections, ramble_sentences, repeat_self)
+        mean_tokens = sum(len(output) for _, output in cases) / len(cases)
+        timings = []
+        for align in ALIGNERS.values():
+            best = float("inf")
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                alignments = [
+                    align(input_tokens, output_tokens)
+                    for input_tokens, output_tokens in cases
+                ]
+                best = min(best, time.perf_counter() - start)
+            edits = sum(
+                a_token != b_token
+                for alignment in alignments
+                for a_token, b_token in alignment
+            )
+            timings.append(f"{best * 1000:.1f} ms / {edits} edits")
+        rambling = "repeated sentence" if repeat_self else "other sentences"
+        print(
+            f"| {rambling} | {ramble_sentences} | {mean_tokens:.0f} | {' | '.join(timings)} |"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark of the startup time of the icestabs-eval CLI.
+
+Times `icestabs-eval --help` and a bare `import icestabs_evaluation` in fresh interpreters, next
+to an empty interpreter as the baseline, and checks that importing the package does not import
+any of the heavy dependencies (pandas, NumPy, the tokenizer, YAML, rich), which are only loaded
+when an evaluation needs them. Exits with status 1 if one of them is imported at startup, or if
+`--max-ms` is given and `--help` takes longer than that.
+
+Usage:
+    python benchmarks/startup.py [--repeat N] [--max-ms MS]
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ["pandas", "numpy", "tokenizer", "yaml", "rich"]
+
+COMMANDS = {
+    "python (baseline)": [sys.executable, "-c", "pass"],
+    "import icestabs_evaluation": [sys.executable, "-c", "import icestabs_evaluation"],
+    "icestabs-eval --help": [sys.executable, "-m", "icestabs_evaluation.cli", "--help"],
+}
+
+
+def best_time(command, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def imported_heavy_modules() -> list:
+    check = (
+        "import sys, icestabs_evaluation.cli; "
+        f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", check], check=True, capture_output=True, text=True
+    ).stdout
+    return output.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "--max-ms", type=float, default=None, help="Fail if --help takes longer than this"
+    )
+    args = parser.parse_args()
+
+    print(f"| command | best of {args.repeat} |")
+    print("|---|---|")
+    timings = {}
+    for name, command in COMMANDS.items():
+        timings[name] = best_time(command, args.repeat)
+        print(f"| {name} | {timings[name] * 1000:.1f} ms |")
+
+    failed = False
+    heavy = imported_heavy_modules()
+    if heavy:
+        print(f"\nImported at startup: {', '.join(heavy)}")
+        failed = True
+    help_ms = timings["icestabs-eval --help"] * 1000
+    if args.max_ms is not None and help_ms > args.max_ms:
+        print(f"\n--help took {help_ms:.1f} ms, more than {args.max_ms:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
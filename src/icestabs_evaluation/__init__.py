@@ -1,7 +1,8 @@
-import json
-import yaml
+from importlib import import_module
+from types import MappingProxyType
+from typing import TYPE_CHECKING
 from typing import List
-from typing import Dict, List
+from typing import Dict, List, Mapping, Optional, Tuple
 from dataclasses import dataclass
 
 
@@ -22,9 +23,10 @@ class _StatOverview:
     tn_score: int  # true negative tokens
     fn_score: int  # false negative tokens
     sent_level_correct: int  # 1 if the output is identical to expected, 0 otherwise
+    fast_path: int  # 1 if the output is identical to the input or expected, and was scored without alignment
 
 
-@dataclass
+@dataclass(slots=True)
 class RuleExample:
     original_sentence: str
     standardized_sentence: str
@@ -33,11 +35,11 @@ class RuleExample:
     standardized_part: str
 
 
-@dataclass
+@dataclass(slots=True)
 class SingleRule:
     short_suggestion: str
     long_suggestion: str
-    examples: List[RuleExample]
+    examples: List[Optional[RuleExample]]
     error_code: str
     ritreglur_url: str
 
@@ -46,40 +48,46 @@ class RulesContainer:
     """
     RulesContainer is a class that manages a collection of rules and provides methods to retrieve original and standardized sentences from these rules.
 
+    The sets and examples are precomputed once, column by column, when the container is created, and the
+    getters return the same read-only views (tuples and mapping proxies) on every call. The rules must
+    therefore not be modified after the container is created.
+
     Attributes:
         rules (Dict[str, SingleRule]): A dictionary where keys are rule identifiers and values are SingleRule objects.
+        rule_names (Tuple[str, ...]): The rule identifiers, in order.
+        rule_index (Mapping[str, int]): The position of each rule identifier in rule_names.
 
     Methods:
         __init__(rules: Dict[str, SingleRule]):
             Initializes the RulesContainer with a dictionary of rules.
 
-        get_original_set(set_nr: int) -> List[str]:
+        get_original_set(set_nr: int) -> Tuple[str, ...]:
             Retrieves a specific set of original sentences across all rules.
             Args:
                 set_nr (int): The set number (1, 2, or 3) to retrieve.
             Returns:
-                List[str]: A list of original sentences from the specified set.
+                Tuple[str, ...]: The original sentences from the specified set.
             Raises:
                 ValueError: If the set number is not 1, 2, or 3.
 
-        get_standardized_set(set_nr: int) -> List[str]:
+        get_standardized_set(set_nr: int) -> Tuple[str, ...]:
             Retrieves a specific set of standardized sentences across all rules.
             Args:
                 set_nr (int): The set number (1, 2, or 3) to retrieve.
             Returns:
-                List[str]: A list of standardized sentences from the specified set.
+                Tuple[str, ...]: The standardized sentences from the specified set.
             Raises:
                 ValueError: If the set number is not 1, 2, or 3.
 
-        get_original_examples() -> Dict[str, List[str]]:
+        get_original_examples() -> Mapping[str, Tuple[str, ...]]:
             Retrieves all the original examples from the rules.
             Returns:
-                Dict[str, List[str]]: A dictionary where keys are rule identifiers and values are lists of original sentences.
+                Mapping[str, Tuple[str, ...]]: A read-only mapping where keys are rule identifiers and values are the original sentences.
 
-        get_standardized_examples() -> Dict[str, List[str]]:
+        get_standardized_examples() -> Mapping[str, Tuple[str, ...]]:
             Retrieves all the standardized examples from the rules.
             Returns:
-                Dict[str, List[str]]: A dictionary where keys are rule identifiers and values are lists of standardized sentences.
+                Mapping[str, Tuple[str, ...]]: A read-only mapping where keys are rule identifiers and values are the standardized sentences.
 
         keys():
             Retrieves the keys of the rules dictionary.
@@ -89,50 +97,61 @@ class RulesContainer:
 
     def __init__(self, rules: Dict[str, SingleRule]):
         self.rules = rules
+        self.rule_names = tuple(rules.keys())
+        self.rule_index = MappingProxyType(
+            {key: index for index, key in enumerate(self.rule_names)}
+        )
+        # one column per example set and field, skipping the rules without that example
+        self._original_sets = tuple(
+            tuple(
+                rule.examples[set_nr].original_sentence
+                for rule in rules.values()
+                if rule.examples[set_nr] is not None
+            )
+            for set_nr in range(3)
+        )
+        self._standardized_sets = tuple(
+            tuple(
+                rule.examples[set_nr].standardized_sentence
+                for rule in rules.values()
+                if rule.examples[set_nr] is not None
+            )
+            for set_nr in range(3)
+        )
+        self._original_examples = MappingProxyType(
+            {
+                key: tuple(ex.original_sentence for ex in rule.examples if ex is not None)
+                for key, rule in rules.items()
+            }
+        )
+        self._standardized_examples = MappingProxyType(
+            {
+                key: tuple(
+                    ex.standardized_sentence for ex in rule.examples if ex is not None
+                )
+                for key, rule in rules.items()
+            }
+        )
 
-    def get_original_set(self, set_nr: int) -> List[str]:
+    def get_original_set(self, set_nr: int) -> Tuple[str, ...]:
         """Get a specific set of original sentences across all rules."""
         if set_nr not in [1, 2, 3]:
             raise ValueError(f"Invalid example set number: {set_nr}")
-        set_nr = set_nr - 1
-        return [
-            self.rules[key].examples[set_nr].original_sentence
-            for key in self.rules.keys()
-            if self.rules[key].examples[set_nr] is not None
-        ]
-
-    def get_standardized_set(self, set_nr: int) -> List[str]:
+        return self._original_sets[set_nr - 1]
+
+    def get_standardized_set(self, set_nr: int) -> Tuple[str, ...]:
         """Get a specific set of standardized sentences across all rules."""
         if set_nr not in [1, 2, 3]:
             raise ValueError(f"Invalid example set number: {set_nr}")
-        set_nr = set_nr - 1
-        return [
-            self.rules[key].examples[set_nr].standardized_sentence
-            for key in self.rules.keys()
-            if self.rules[key].examples[set_nr] is not None
-        ]
-
-    def get_original_examples(self) -> Dict[str, List[str]]:
+        return self._standardized_sets[set_nr - 1]
+
+    def get_original_examples(self) -> Mapping[str, Tuple[str, ...]]:
         """Get all the original examples from the rules."""
-        return {
-            key: [
-                ex.original_sentence
-                for ex in self.rules[key].examples
-                if ex is not None
-            ]
-            for key in self.rules.keys()
-        }
-
-    def get_standardized_examples(self) -> Dict[str, List[str]]:
+        return self._original_examples
+
+    def get_standardized_examples(self) -> Mapping[str, Tuple[str, ...]]:
         """Get all the standardized examples from the rules."""
-        return {
-            key: [
-                ex.standardized_sentence
-                for ex in self.rules[key].examples
-                if ex is not None
-            ]
-            for key in self.rules.keys()
-        }
+        return self._standardized_examples
 
     def keys(self):
         return self.rules.keys()
@@ -153,6 +172,8 @@ def load_config_yaml(config_filepath: str) -> RulesContainer:
     Raises:
         FileNotFoundError: If the file at the specified path does not exist.
     """
+    import yaml
+
     try:
         with open(config_filepath, "r") as f:
             config = yaml.safe_load(f)
@@ -167,6 +188,8 @@ def load_rules_json(rules_filepath: str) -> RulesContainer:
     """
     Load rules from a JSON file and convert them into a RulesContainer object.
     """
+    import json
+
     try:
         with open(rules_filepath, "r") as f:
             rules = json.load(f)
@@ -193,17 +216,49 @@ def load_rules_json(rules_filepath: str) -> RulesContainer:
         )
 
 
-from .statistics import (
-    data_from_tsv,
-    data_from_dict,
-    build_overview_data,
-)
+# The evaluation functions are imported on first access, as they pull in pandas, NumPy and the
+# tokenizer, so that importing the package (and e.g. `icestabs-eval --help`) stays fast.
+_LAZY_ATTRIBUTES = {
+    "data_from_tsv": "statistics",
+    "data_from_store": "statistics",
+    "data_from_dict": "statistics",
+    "build_overview_data": "statistics",
+    "build_benchmark_index": "statistics",
+    "token_level_eval_many": "token_level_eval",
+}
+
+if TYPE_CHECKING:
+    from .statistics import (
+        data_from_tsv,
+        data_from_store,
+        data_from_dict,
+        build_overview_data,
+        build_benchmark_index,
+    )
+    from .token_level_eval import token_level_eval_many
+
+
+def __getattr__(name: str):
+    try:
+        module_name = _LAZY_ATTRIBUTES[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    value = getattr(import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
 
 
 __all__ = [
-    data_from_tsv,
-    data_from_dict,
-    build_overview_data,
-    load_rules_json,
-    load_config_yaml,
+    "data_from_tsv",
+    "data_from_store",
+    "data_from_dict",
+    "build_overview_data",
+    "build_benchmark_index",
+    "token_level_eval_many",
+    "load_rules_json",
+    "load_config_yaml",
 ]
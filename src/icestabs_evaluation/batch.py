@@ -0,0 +1,162 @@
+import logging
+import os
+import re
+from glob import glob
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from pandas import DataFrame
+from . import IceStaBSEvalException, RulesContainer
+from .profiling import profiled
+from .score_cache import ScoreCache
+from .statistics import get_tool_columns
+from .token_level_eval import BenchmarkTokenIndex
+
+
+logger = logging.getLogger(__name__)
+
+# output files for a single example set are named 'ex_{example_nr}_{tool_name}.txt', as in M14-Eval/data/output_manual
+_EXAMPLE_FILE_PATTERN = re.compile(r"^ex_([123])_(.+)$")
+
+
+def discover_output_files(paths: List[str]) -> List[str]:
+    """
+    Expand a list of files, directories and glob patterns into a sorted list of output files.
+    Directories are expanded to the '.txt' files they contain.
+    """
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            files.update(glob(os.path.join(path, "*.txt")))
+        elif os.path.isfile(path):
+            files.add(path)
+        else:
+            matches = [match for match in glob(path) if os.path.isfile(match)]
+            if not matches:
+                logger.warning(f"No output files found for: {path}")
+            files.update(matches)
+    return sorted(files)
+
+
+def output_file_columns(filepath: str) -> Tuple[str, List[int]]:
+    """
+    Get the tool name and the example sets of an output file, from its file name.
+
+    'ex_1_puki.txt' holds the outputs of the tool 'puki' for example set 1, one line per rule.
+    Any other file, e.g. 'puki.txt', holds the outputs for all three example sets, in the single file format.
+    """
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    match = _EXAMPLE_FILE_PATTERN.match(name)
+    if match:
+        return match.group(2), [int(match.group(1))]
+    return name, [1, 2, 3]
+
+
+def benchmark_frame(rules: RulesContainer) -> DataFrame:
+    """Build a corrections DataFrame with the rules and the original and standardized sentences of the benchmark."""
+    frame = DataFrame({"rule": list(rules.keys())})
+    for set_nr in range(1, 4):
+        frame[f"ex_{set_nr}_original"] = rules.get_original_set(set_nr)
+        frame[f"ex_{set_nr}_standardized"] = rules.get_standardized_set(set_nr)
+    return frame
+
+
+@profiled("load_outputs")
+def load_output_files(files: List[str], corrections: DataFrame) -> DataFrame:
+    """
+    Load many tool output files as columns of a corrections DataFrame.
+
+    Trailing empty lines are ignored. Files with an invalid number of lines, or that repeat a tool/example
+    column, are skipped with an error message. Tools that are then left without outputs for all three
+    example sets are left out, with an error message, as their scores would not be comparable.
+
+    Args:
+        files (List[str]): Paths to the output files, see output_file_columns for the naming.
+        corrections (DataFrame): A corrections DataFrame with one row per rule, e.g. from benchmark_frame.
+    Returns:
+        DataFrame: A copy of the corrections, with a 'ex_{example_nr}_{tool_name}' column for each tool and example set.
+    """
+    num_rules = len(corrections)
+    columns = {}
+    for filepath in files:
+        tool_name, set_nrs = output_file_columns(filepath)
+        with open(filepath, "r") as f:
+            lines = [line.strip() for line in f.readlines()]
+        while lines and not lines[-1]:
+            lines.pop()
+        if len(lines) != num_rules * len(set_nrs):
+            logger.error(
+                f"Skipping {filepath}: invalid number of lines. Should be equal to {num_rules * len(set_nrs)}, found {len(lines)}"
+            )
+            continue
+        file_columns = {
+            f"ex_{set_nr}_{tool_name}": lines[i * num_rules : (i + 1) * num_rules]
+            for i, set_nr in enumerate(set_nrs)
+        }
+        duplicates = [
+            col_name
+            for col_name in file_columns
+            if col_name in columns or col_name in corrections.columns
+        ]
+        if duplicates:
+            logger.error(
+                f"Skipping {filepath}: column {duplicates[0]} was already loaded from another file"
+            )
+            continue
+        columns.update(file_columns)
+        logger.info(f"Loaded {filepath} as tool '{tool_name}'")
+
+    loaded_tools = {"_".join(col_name.split("_")[2:]) for col_name in columns}
+    for tool_name in sorted(loaded_tools):
+        tool_columns = [f"ex_{set_nr}_{tool_name}" for set_nr in range(1, 4)]
+        missing = [
+            col_name
+            for col_name in tool_columns
+            if col_name not in columns and col_name not in corrections.columns
+        ]
+        if missing:
+            logger.error(
+                f"Skipping tool '{tool_name}': no valid outputs for {', '.join(missing)}"
+            )
+            for col_name in tool_columns:
+                columns.pop(col_name, None)
+    return corrections.assign(**columns)
+
+
+def evaluate_output_files(
+    paths: List[str],
+    rules: RulesContainer,
+    workers: int = 1,
+    aligner: Union[str, Callable] = None,
+    benchmark_index: Optional[BenchmarkTokenIndex] = None,
+    score_cache: Optional[ScoreCache] = None,
+) -> Dict[str, DataFrame]:
+    """
+    Evaluate many tool output files against the benchmark in one run.
+
+    Args:
+        paths (List[str]): Output files, directories or glob patterns.
+        rules (RulesContainer): The benchmark rules.
+        workers (int): Number of worker processes used for scoring.
+        aligner (str or callable, optional): The token alignment backend.
+        benchmark_index (BenchmarkTokenIndex, optional): A precomputed benchmark token index.
+        score_cache (ScoreCache, optional): A persistent score cache.
+    Returns:
+        Dict[str, DataFrame]: The combined leaderboard tables, see format_leaderboard_tables.
+
+    Raises:
+        IceStaBSEvalException: If none of the files are valid output files.
+    """
+    from .pipeline import evaluate_corrections, format_leaderboard_tables
+
+    files = discover_output_files(paths)
+    logger.info(f"Found {len(files)} output files")
+    corrections = load_output_files(files, benchmark_frame(rules))
+    if not get_tool_columns(corrections):
+        raise IceStaBSEvalException("No valid output files to evaluate.")
+    tables = evaluate_corrections(
+        corrections,
+        workers=workers,
+        aligner=aligner,
+        benchmark_index=benchmark_index,
+        score_cache=score_cache,
+    )
+    return format_leaderboard_tables(tables)
@@ -1,8 +1,14 @@
 import argparse
 import logging
-from typing import Dict
-from pandas import DataFrame
-from . import load_rules_json, IceStaBSEvalException
+import os
+import sys
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Dict
+from . import IceStaBSEvalException
+from .profiling import profiled, profiling, stage
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
 
 
 logger = logging.getLogger(__name__)
@@ -35,13 +41,33 @@ def main():
     single_file_parser.add_argument(
         "--file", "-f", help="Path to the single file to evaluate", required=True
     )
+    add_evaluation_arguments(single_file_parser)
     single_file_parser.add_argument(
-        "--output_format",
-        "-o",
-        help="Output format for the evaluation results",
-        choices=["json", "table"],
-        default="table",
+        "--stream",
+        "-s",
+        action="store_true",
+        help="Score the file line by line with constant memory, reporting partial results for truncated files",
+    )
+
+    # Subparser for evaluating many output files at once
+    batch_parser = subparsers.add_parser(
+        "batch", help="Evaluate many output files and combine them in one leaderboard"
+    )
+    batch_parser.add_argument(
+        "--benchmark",
+        "-b",
+        required=True,
+        help="Path to the IceStaBS benchmark set JSON file",
     )
+    batch_parser.add_argument(
+        "--files",
+        "-f",
+        nargs="+",
+        required=True,
+        help="Output files, directories or glob patterns. The tool name is taken from the file name, "
+        "'ex_1_puki.txt' holds the outputs of 'puki' for example set 1, other files hold all three sets",
+    )
+    add_evaluation_arguments(batch_parser)
 
     # Subparser for config file evaluation
     config_file_parser = subparsers.add_parser(
@@ -51,11 +77,74 @@ def main():
         "--config", "-c", required=True, help="Path to the configuration YAML file"
     )
     config_file_parser.add_argument(
-        "--rules", "-r", required=True, help="Path to the benchmark JSON file"
+        "--rules",
+        "-r",
+        help="Path to the benchmark JSON file, needed if the outputs are not in a corrections TSV file",
+    )
+    config_file_parser.add_argument(
+        "--output_dir",
+        "-d",
+        help="Directory to write the result tables to, as TSV files",
+    )
+    add_evaluation_arguments(config_file_parser)
+
+    # Subparser for corrections TSV file evaluation
+    csv_file_parser = subparsers.add_parser(
+        "csv", help="Evaluate all the tools in a corrections TSV file"
+    )
+    csv_file_parser.add_argument(
+        "--csv",
+        "-f",
+        required=True,
+        help="Path to the corrections TSV file, with 'ex_{example_nr}_{tool_name}' columns",
+    )
+    csv_file_parser.add_argument(
+        "--output_dir",
+        "-d",
+        help="Directory to write the result tables to, as TSV files",
+    )
+    add_evaluation_arguments(csv_file_parser)
+
+    # Subparser for compiling the benchmark into a binary file
+    compile_parser = subparsers.add_parser(
+        "compile",
+        help="Compile the benchmark JSON file into a binary file that loads in milliseconds, "
+        "with the sentences pre-tokenized and pre-aligned",
+    )
+    compile_parser.add_argument(
+        "--benchmark",
+        "-b",
+        required=True,
+        help="Path to the IceStaBS benchmark set JSON file",
+    )
+    compile_parser.add_argument(
+        "--output", "-o", required=True, help="Path of the compiled benchmark file"
+    )
+    compile_parser.add_argument(
+        "--aligner",
+        "-a",
+        choices=["difflib", "levenshtein"],
+        default="difflib",
+        help="Token alignment backend of the precomputed alignments (default: difflib)",
     )
     parser.add_argument(
         "--verbose", "-v", action="store_true", help="Enable verbose logging"
     )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Record the time spent in each stage of the evaluation and print it when done",
+    )
+    parser.add_argument(
+        "--profile_output",
+        help="Path of a file to write the recorded stage times to, implies --profile",
+    )
+    parser.add_argument(
+        "--profile_format",
+        choices=["json", "chrome"],
+        default="json",
+        help="Format of the profile file, the stage totals as JSON, or a Chrome trace of every stage call (default: json)",
+    )
 
     args = parser.parse_args()
 
@@ -64,33 +153,148 @@ def main():
     else:
         logging.basicConfig(level=logging.WARNING)
 
-    # Handling different modes
+    profile = args.profile or args.profile_output
+    with profiling() if profile else nullcontext() as profiler:
+        run_mode(args, parser)
+    if profiler is not None:
+        report_profile(args, profiler)
+
+
+def run_mode(args: argparse.Namespace, parser: argparse.ArgumentParser):
+    """Run the evaluation mode selected in the arguments."""
     if args.mode == "single":
         logger.info(f"Evaluating single file: {args.file} with tool {args.tool_name}")
         logger.info(f"Using benchmark file: {args.benchmark}")
         global RULES
-        RULES = load_rules_json(args.benchmark)
+        RULES, benchmark_index = load_benchmark(args.benchmark, args.aligner)
         logger.info("Rules loaded successfully")
 
-        evaluate_single_output(args, RULES)
+        if args.stream:
+            evaluate_single_output_stream(args, RULES, benchmark_index)
+        else:
+            evaluate_single_output(args, RULES, benchmark_index)
         # Add your logic for single file evaluation here
 
+    elif args.mode == "batch":
+        logger.info(f"Evaluating output files: {' '.join(args.files)}")
+        logger.info(f"Using benchmark file: {args.benchmark}")
+        RULES, benchmark_index = load_benchmark(args.benchmark, args.aligner)
+        logger.info("Rules loaded successfully")
+
+        evaluate_batch(args, RULES, benchmark_index)
+
     elif args.mode == "csv":
         logger.info(f"Evaluating with csv file: {args.csv}")
-        logger.info(f"Using benchmark file: {args.benchmark}")
 
-        # Add your logic for csv file-based evaluation
+        evaluate_csv(args)
 
     elif args.mode == "config":
         logger.info(f"Evaluating with config file: {args.config}")
-        logger.info(f"Using benchmark file: {args.benchmark}")
+        RULES = benchmark_index = None
+        if args.rules:
+            logger.info(f"Using benchmark file: {args.rules}")
+            RULES, benchmark_index = load_benchmark(args.rules, args.aligner)
+            logger.info("Rules loaded successfully")
 
-        # Add your logic for config file-based evaluation here
+        evaluate_config(args, RULES, benchmark_index)
+
+    elif args.mode == "compile":
+        compile_benchmark_file(args)
 
     else:
         parser.print_help()
 
 
+def load_benchmark(benchmark_path: str, aligner: str):
+    """
+    Load the benchmark from a JSON file or a compiled benchmark file.
+
+    Returns the rules and, for a compiled file with the same aligner, a prefilled benchmark token index (else None).
+    """
+    from .compiled_benchmark import load_benchmark as load_benchmark_file
+
+    with stage("load_benchmark"):
+        rules, benchmark_index = load_benchmark_file(benchmark_path, aligner)
+    if benchmark_index is not None:
+        logger.info(
+            f"Loaded {len(benchmark_index)} pre-tokenized sentence pairs from the compiled benchmark"
+        )
+    return rules, benchmark_index
+
+
+def compile_benchmark_file(args: argparse.Namespace):
+    """Compile the benchmark JSON file, unless the compiled file is already up to date."""
+    from .compiled_benchmark import (
+        CompiledBenchmark,
+        compile_benchmark,
+        is_compiled_benchmark,
+    )
+
+    if os.path.exists(args.output) and is_compiled_benchmark(args.output):
+        try:
+            with CompiledBenchmark(args.output) as compiled:
+                up_to_date = (
+                    compiled.is_current(args.benchmark)
+                    and compiled.aligner == args.aligner
+                )
+        except IceStaBSEvalException:
+            up_to_date = False
+        if up_to_date:
+            logger.info(f"{args.output} is up to date with {args.benchmark}")
+            return
+    logger.info(f"Compiling {args.benchmark} to {args.output}")
+    with stage("compile"):
+        compile_benchmark(args.benchmark, args.output, aligner=args.aligner)
+    logger.info("Benchmark compiled successfully")
+
+
+def add_evaluation_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the arguments shared by all the evaluation modes to a subparser."""
+    parser.add_argument(
+        "--output_format",
+        "-o",
+        help="Output format for the evaluation results",
+        choices=["json", "table"],
+        default="table",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="Number of worker processes used for scoring (default: 1)",
+    )
+    parser.add_argument(
+        "--aligner",
+        "-a",
+        choices=["difflib", "levenshtein"],
+        default="difflib",
+        help="Token alignment backend (default: difflib)",
+    )
+    parser.add_argument(
+        "--cache",
+        help="Path to a persistent score cache file (SQLite), so that only new or changed outputs are scored",
+    )
+
+
+def open_score_cache(args: argparse.Namespace):
+    """Open the score cache given in the arguments, or return None if there is none."""
+    if not getattr(args, "cache", None):
+        return None
+    from .score_cache import ScoreCache
+
+    logger.info(f"Using score cache: {args.cache}")
+    return ScoreCache(args.cache)
+
+
+def log_score_cache(score_cache) -> None:
+    if score_cache is not None:
+        logger.info(
+            f"Score cache: {score_cache.hits} cells found, {score_cache.misses} cells scored"
+        )
+        score_cache.close()
+
+
 def list_to_dict(tool_name, rule_classes, lines) -> dict:
     interim = zip(list(rule_classes) * 3, lines)
     result = {}
@@ -111,21 +315,39 @@ def validate_input_file(lines, rule_classes):
     logger.info("Input file length valid.")
 
 
-def tables_to_json(tables: Dict[str, DataFrame]) -> Dict[str, dict]:
+def report_profile(args: argparse.Namespace, profiler) -> None:
+    """Print the recorded stage times, and write them to args.profile_output, if given."""
+    if args.profile:
+        print(profiler.format_table(), file=sys.stderr)
+    if args.profile_output:
+        if args.profile_format == "chrome":
+            profiler.write_chrome_trace(args.profile_output)
+        else:
+            profiler.write_json(args.profile_output)
+        logger.info(f"Wrote profile to {args.profile_output}")
+
+
+def tables_to_json(tables: Dict[str, "DataFrame"]) -> Dict[str, dict]:
     return {
         table_name: table.to_dict(orient="records")
         for table_name, table in tables.items()
     }
 
 
+@profiled("render")
 def format_visual_summary(
-    tool_name: str, tables: Dict[str, DataFrame], output_format: str
+    tool_name: str,
+    tables: Dict[str, "DataFrame"],
+    output_format: str,
+    title: str = None,
 ):
     """Basic visual summary of the evaluation results.
 
     Args:
         tool_name (str): Name of the tool that is being described.
         tables (List[DataFrame]): List of DataFrames to display.
+        output_format (str): 'json' or 'table'.
+        title (str, optional): Title of the summary. Defaults to a summary for the single tool.
     """
     from rich.console import Console
 
@@ -135,20 +357,23 @@ def format_visual_summary(
         console.print(tables_to_json(tables))
         return
     if output_format == "table":
-        console.print(f"\n[bold]Summary for single tool: '{tool_name}'[/bold]\n")
+        if title is None:
+            title = f"Summary for single tool: '{tool_name}'"
+        console.print(f"\n[bold]{title}[/bold]\n")
 
         for table_name, table in tables.items():
             console.print(f"[bold]{table_name}:[/bold]")
             console.print(f"{table.to_markdown(tablefmt='github', index=False)}\n")
 
 
-def evaluate_single_output(args: argparse.Namespace, RULES):
+def evaluate_single_output(args: argparse.Namespace, RULES, benchmark_index=None):
     """
     Evaluates the output of a single tool based on the provided arguments and benchmark.
 
     Args:
         args (argparse.Namespace): The command-line arguments containing the input file and tool name.
         RULES: An object containing the benchmark and methods to retrieve original and standardized examples.
+        benchmark_index (BenchmarkTokenIndex, optional): A prefilled benchmark token index, e.g. from a compiled benchmark.
 
     Returns:
         None
@@ -171,6 +396,7 @@ def evaluate_single_output(args: argparse.Namespace, RULES):
         generate_summary_table,
         generate_per_rule_table,
         f_score_per_tool,
+        fast_path_per_tool,
     )
 
     input_file = args.file
@@ -179,19 +405,28 @@ def evaluate_single_output(args: argparse.Namespace, RULES):
     lines = []
 
     logger.info(f"Loading file: {input_file}")
-    with open(args.file, "r") as f:
-        lines = f.readlines()
-        lines = [line.strip() for line in lines]
-    logger.info(f"File loaded successfully!")
-
-    data_dict = list_to_dict(tool_name, rule_classes, lines)
-    data_dict["original"] = RULES.get_original_examples()
-    data_dict["standardized"] = RULES.get_standardized_examples()
-    data = data_from_dict(data_dict)
+    with stage("load_outputs", tool=tool_name):
+        with open(args.file, "r") as f:
+            lines = f.readlines()
+            lines = [line.strip() for line in lines]
+        logger.info(f"File loaded successfully!")
+
+        data_dict = list_to_dict(tool_name, rule_classes, lines)
+        data_dict["original"] = RULES.get_original_examples()
+        data_dict["standardized"] = RULES.get_standardized_examples()
+        data = data_from_dict(data_dict)
     logger.info("Data loaded successfully!")
 
     # generate the main overview data used for the calculation
-    overview_data = build_overview_data(data)
+    score_cache = open_score_cache(args)
+    overview_data = build_overview_data(
+        data,
+        benchmark_index=benchmark_index,
+        workers=args.jobs,
+        aligner=args.aligner,
+        score_cache=score_cache,
+    )
+    log_score_cache(score_cache)
 
     # format the summary table
     summary_table = generate_summary_table(overview_data)
@@ -216,10 +451,171 @@ def evaluate_single_output(args: argparse.Namespace, RULES):
         "Score per example": summary_table,
         "Score per rule chapter": per_rule_table,
         "F1 scores per tool": f1_scores_table,
+        "Fast path hits per tool": fast_path_per_tool(overview_data),
     }
 
     format_visual_summary(tool_name, tables, args.output_format)
 
 
+def evaluate_single_output_stream(args: argparse.Namespace, RULES, benchmark_index=None):
+    """
+    Evaluates the output of a single tool as a stream, reading the file line by line.
+
+    Each line is paired with its benchmark example, scored and folded into running aggregates,
+    so the whole file is never held in memory. If the file has fewer lines than the benchmark,
+    the results for the lines read so far are reported, with a warning. If it has more, the
+    results for the first lines are reported, also with a warning.
+
+    Args:
+        args (argparse.Namespace): The command-line arguments containing the input file and tool name.
+        RULES: An object containing the benchmark and methods to retrieve original and standardized examples.
+        benchmark_index (BenchmarkTokenIndex, optional): A prefilled benchmark token index, e.g. from a compiled benchmark.
+
+    Returns:
+        None
+    """
+    from .streaming import evaluate_stream
+
+    if args.jobs != 1:
+        logger.warning("--jobs is ignored with --stream, the lines are scored one at a time")
+    if args.cache:
+        logger.warning("--cache is ignored with --stream, every line is scored")
+    logger.info(f"Streaming file: {args.file}")
+    with open(args.file, "r") as f:
+        evaluation = evaluate_stream(
+            args.tool_name,
+            f,
+            RULES,
+            benchmark_index=benchmark_index,
+            aligner=args.aligner,
+        )
+
+    if not evaluation.is_complete:
+        logger.warning(
+            f"The file is truncated: {evaluation.lines_scored} of {evaluation.expected_lines} lines scored. Reporting partial results."
+        )
+    elif evaluation.extra_lines:
+        logger.warning(
+            f"The file has {evaluation.extra_lines} lines more than the {evaluation.expected_lines} lines of the benchmark. Reporting the results for the first {evaluation.expected_lines} lines."
+        )
+    else:
+        logger.info(f"{evaluation.lines_scored} lines scored successfully!")
+
+    format_visual_summary(args.tool_name, evaluation.tables(), args.output_format)
+
+
+def evaluate_batch(args: argparse.Namespace, RULES, benchmark_index=None):
+    """
+    Evaluates many tool output files in one run, and shows a combined leaderboard.
+
+    The benchmark is loaded and tokenized once for all the files, and the scoring is
+    split across args.jobs worker processes.
+
+    Args:
+        args (argparse.Namespace): The command-line arguments containing the output files.
+        RULES: An object containing the benchmark and methods to retrieve original and standardized examples.
+        benchmark_index (BenchmarkTokenIndex, optional): A prefilled benchmark token index, e.g. from a compiled benchmark.
+
+    Returns:
+        None
+    """
+    from .batch import evaluate_output_files
+
+    score_cache = open_score_cache(args)
+    tables = evaluate_output_files(
+        args.files,
+        RULES,
+        workers=args.jobs,
+        aligner=args.aligner,
+        benchmark_index=benchmark_index,
+        score_cache=score_cache,
+    )
+    log_score_cache(score_cache)
+    num_tools = len(tables["F1 scores per tool"])
+    format_visual_summary(
+        None,
+        tables,
+        args.output_format,
+        title=f"Leaderboard for {num_tools} tools",
+    )
+
+
+def report_corrections(
+    args: argparse.Namespace, corrections: "DataFrame", title: str, benchmark_index=None
+):
+    """
+    Evaluates all the tools of a corrections DataFrame in one pass, shows the combined
+    leaderboard and writes the tables to args.output_dir, if given.
+
+    A prefilled benchmark token index, e.g. from a compiled benchmark, is used if given.
+    """
+    from .pipeline import evaluate_corrections, format_leaderboard_tables, write_tables
+
+    score_cache = open_score_cache(args)
+    tables = format_leaderboard_tables(
+        evaluate_corrections(
+            corrections,
+            workers=args.jobs,
+            aligner=args.aligner,
+            benchmark_index=benchmark_index,
+            score_cache=score_cache,
+        )
+    )
+    log_score_cache(score_cache)
+    if args.output_dir:
+        for filepath in write_tables(tables, args.output_dir):
+            logger.info(f"Wrote {filepath}")
+
+    num_tools = len(tables["F1 scores per tool"])
+    format_visual_summary(
+        None, tables, args.output_format, title=f"{title} ({num_tools} tools)"
+    )
+
+
+def evaluate_csv(args: argparse.Namespace):
+    """
+    Evaluates all the tools in a corrections TSV file, like M14-Eval/data/corrections.tsv.
+
+    The file holds the original and standardized sentences of the benchmark, so no benchmark file is needed.
+    """
+    from . import data_from_tsv
+
+    corrections = data_from_tsv(args.csv)
+    if corrections.empty:
+        raise IceStaBSEvalException(f"No data found in {args.csv}")
+    if "Unnamed: 0" in corrections.columns:
+        corrections = corrections.drop(columns=["Unnamed: 0"])
+    logger.info("Data loaded successfully!")
+
+    report_corrections(args, corrections, title=f"Leaderboard for '{args.csv}'")
+
+
+def evaluate_config(args: argparse.Namespace, RULES, benchmark_index=None):
+    """
+    Evaluates all the tools of an evaluation config, like M14-Eval/M14-eval-config.yml.
+
+    The tool outputs are read from the corrections TSV file of the config, or from the per-tool
+    output files, and scored in a single pass with a shared benchmark index.
+
+    Args:
+        args (argparse.Namespace): The command-line arguments containing the config file.
+        RULES: The benchmark rules, or None if the outputs are read from the corrections TSV file.
+        benchmark_index (BenchmarkTokenIndex, optional): A prefilled benchmark token index, e.g. from a compiled benchmark.
+
+    Returns:
+        None
+    """
+    from . import load_config_yaml
+    from .pipeline import load_config_corrections
+
+    config = load_config_yaml(args.config)
+    corrections = load_config_corrections(config, args.config, rules=RULES)
+    logger.info("Data loaded successfully!")
+
+    report_corrections(
+        args, corrections, title=f"Leaderboard for '{args.config}'", benchmark_index=benchmark_index
+    )
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,377 @@
+import logging
+import mmap
+import struct
+from array import array
+from hashlib import sha256
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from numpy import asarray, frombuffer, int32, uint32
+from . import (
+    IceStaBSEvalException,
+    RuleExample,
+    RulesContainer,
+    SingleRule,
+    load_rules_json,
+)
+from .token_level_eval import (
+    _TAG_BITS,
+    _TAG_MASK,
+    DEFAULT_ALIGNER,
+    BenchmarkTokenIndex,
+    _ExpectedTokens,
+    tokenizer_version,
+)
+
+logger = logging.getLogger(__name__)
+
+
+_MAGIC = b"ISBC"
+# bump when the layout of the compiled file changes
+FORMAT_VERSION = 3
+
+# magic, format version, sha256 of the source JSON, aligner name, tokenizer version, then the
+# counts of: strings, token strings, string characters, rules, sentence pairs, input tokens,
+# expected actions
+_HEADER = struct.Struct("<4sI32s16s32s7I")
+
+_RULE_FIELDS = ["short_suggestion", "long_suggestion", "error_code", "ritreglur_url"]
+_EXAMPLE_FIELDS = [
+    "original_sentence",
+    "standardized_sentence",
+    "suggestion",
+    "original_part",
+    "standardized_part",
+]
+# a rule row holds the rule name, the rule fields and the fields of the three examples
+_RULE_ROW = 1 + len(_RULE_FIELDS) + 3 * len(_EXAMPLE_FIELDS)
+# a pair row holds the sentence string ids and the ranges of its tokens and actions
+_PAIR_ROW = 6
+
+_NONE = -1  # a field that is None
+_MISSING = -2  # an example that is missing (marks the first field of the example)
+
+
+def source_hash(rules_filepath: str) -> bytes:
+    """The version of a benchmark JSON file, as the SHA-256 of its contents."""
+    with open(rules_filepath, "rb") as f:
+        return sha256(f.read()).digest()
+
+
+def _aligner_name(aligner: Union[str, Callable]) -> str:
+    if aligner is None:
+        return DEFAULT_ALIGNER
+    if not isinstance(aligner, str):
+        raise ValueError("Only the named aligners can be compiled into a benchmark file")
+    return aligner
+
+
+class _StringTable:
+    def __init__(self, strings: List[str] = ()):
+        self.ids: Dict[str, int] = {string: i for i, string in enumerate(strings)}
+
+    def id(self, text: Optional[str]) -> int:
+        if text is None:
+            return _NONE
+        return self.ids.setdefault(text, len(self.ids))
+
+
+def _padding(size: int) -> bytes:
+    return b"\0" * (-size % 8)
+
+
+def compile_benchmark(
+    rules_filepath: str, output_filepath: str, aligner: Union[str, Callable] = None
+) -> None:
+    """
+    Compile a benchmark JSON file into a binary file that loads in milliseconds.
+
+    The compiled file holds a string table (every rule field and token, stored once), the rules as
+    rows of string ids, and for every (original, standardized) sentence pair of the benchmark the
+    token ids of the original sentence and the expected action codes, aligned with the given aligner.
+    The tokens come first in the string table, in the order of the interner of the benchmark token
+    index, so the token ids of the file are the ids of a fresh interner seeded with them.
+    It is versioned by the SHA-256 of the source JSON file and the version of the tokenizer, see
+    is_current.
+
+    Args:
+        rules_filepath (str): Path to the benchmark JSON file.
+        output_filepath (str): Path of the compiled file to write.
+        aligner (str, optional): The token alignment backend used for the expected actions.
+    """
+    aligner = _aligner_name(aligner)
+    rules = load_rules_json(rules_filepath)
+    index = BenchmarkTokenIndex(aligner=aligner)
+
+    pair_rows = []
+    token_ids = array("i")
+    action_codes = array("i")
+    for rule in rules.rules.values():
+        for example in rule.examples:
+            if example is None:
+                continue
+            pair = (example.original_sentence, example.standardized_sentence)
+            if pair in index:
+                continue
+            entry = index.get(*pair)
+            pair_rows.append(
+                [
+                    *pair,
+                    len(token_ids),
+                    len(token_ids) + len(entry.input_ids),
+                    len(action_codes),
+                    len(action_codes) + len(entry.expected_actions),
+                ]
+            )
+            token_ids.extend(entry.input_ids)
+            action_codes.extend(entry.expected_actions)
+
+    num_token_strings = len(index.interner)
+    strings = _StringTable(index.interner.strings)
+    for row in pair_rows:
+        row[0], row[1] = strings.id(row[0]), strings.id(row[1])
+
+    rule_rows = []
+    for name, rule in rules.rules.items():
+        row = [strings.id(name)]
+        row.extend(strings.id(getattr(rule, field)) for field in _RULE_FIELDS)
+        for example in rule.examples:
+            if example is None:
+                row.extend([_MISSING] + [_NONE] * (len(_EXAMPLE_FIELDS) - 1))
+            else:
+                row.extend(strings.id(getattr(example, field)) for field in _EXAMPLE_FIELDS)
+        rule_rows.append(row)
+
+    # the strings are stored as one text with character offsets, so loading decodes it in one go
+    text = "".join(strings.ids)
+    offsets = [0]
+    for string in strings.ids:
+        offsets.append(offsets[-1] + len(string))
+    text_bytes = text.encode("utf-8")
+
+    sections = [
+        asarray(offsets, dtype=uint32).tobytes(),
+        text_bytes,
+        asarray(rule_rows, dtype=int32).reshape(-1, _RULE_ROW).tobytes(),
+        asarray(pair_rows, dtype=int32).reshape(-1, _PAIR_ROW).tobytes(),
+        asarray(token_ids, dtype=int32).tobytes(),
+        asarray(action_codes, dtype=int32).tobytes(),
+    ]
+    header = _HEADER.pack(
+        _MAGIC,
+        FORMAT_VERSION,
+        source_hash(rules_filepath),
+        aligner.encode("ascii"),
+        tokenizer_version().encode("ascii"),
+        len(strings.ids),
+        num_token_strings,
+        len(text_bytes),
+        len(rule_rows),
+        len(pair_rows),
+        len(token_ids),
+        len(action_codes),
+    )
+    with open(output_filepath, "wb") as f:
+        f.write(header + _padding(len(header)))
+        for section in sections:
+            f.write(section + _padding(len(section)))
+
+
+def is_compiled_benchmark(filepath: str) -> bool:
+    """Whether a file is a compiled benchmark, judged by its first bytes."""
+    with open(filepath, "rb") as f:
+        return f.read(len(_MAGIC)) == _MAGIC
+
+
+class CompiledBenchmark:
+    """
+    A compiled benchmark file, see compile_benchmark, read through a memory map.
+
+    The numeric sections are NumPy views of the map, which are only valid until the file is
+    closed. The string table is decoded once, on load. load_benchmark copies what it needs out of
+    the sections and closes the file, so nothing stays mapped or is shared between processes.
+
+    Attributes:
+        path (str): Path to the compiled file.
+        source_hash (bytes): The SHA-256 of the benchmark JSON file it was compiled from.
+        aligner (str): The aligner of the expected actions.
+        tokenizer_version (str): The version of the tokenizer the sentences were tokenized with.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # an empty file cannot be mapped
+                raise IceStaBSEvalException(f"{path} is not a compiled benchmark file")
+        try:
+            self._load()
+        except BaseException:
+            # no views of the map exist yet, the checks all come before the first one
+            self._map.close()
+            raise
+
+    def _load(self) -> None:
+        if len(self._map) < _HEADER.size:
+            raise IceStaBSEvalException(f"{self.path} is not a compiled benchmark file")
+        (
+            magic,
+            version,
+            self.source_hash,
+            aligner,
+            tokenizer,
+            num_strings,
+            self.num_token_strings,
+            text_size,
+            num_rules,
+            num_pairs,
+            num_tokens,
+            num_actions,
+        ) = _HEADER.unpack_from(self._map)
+        if magic != _MAGIC:
+            raise IceStaBSEvalException(f"{self.path} is not a compiled benchmark file")
+        if version != FORMAT_VERSION:
+            raise IceStaBSEvalException(
+                f"Unsupported compiled benchmark version {version} in {self.path}, "
+                "please recompile it"
+            )
+        self.aligner = aligner.rstrip(b"\0").decode("ascii")
+        self.tokenizer_version = tokenizer.rstrip(b"\0").decode("ascii")
+
+        # the sections in file order, in bytes
+        sizes = [
+            4 * (num_strings + 1),
+            text_size,
+            4 * num_rules * _RULE_ROW,
+            4 * num_pairs * _PAIR_ROW,
+            4 * num_tokens,
+            4 * num_actions,
+        ]
+        starts = []
+        position = _HEADER.size + len(_padding(_HEADER.size))
+        for size in sizes:
+            starts.append(position)
+            position += size + len(_padding(size))
+        if len(self._map) < position:
+            raise IceStaBSEvalException(f"{self.path} is truncated, please recompile it")
+
+        offsets = frombuffer(self._map[starts[0] : starts[0] + sizes[0]], dtype=uint32).tolist()
+        text = bytes(self._map[starts[1] : starts[1] + text_size]).decode("utf-8")
+        self.strings: List[str] = [
+            text[start:end] for start, end in zip(offsets, offsets[1:])
+        ]
+        self.rule_rows = frombuffer(
+            self._map, dtype=int32, count=num_rules * _RULE_ROW, offset=starts[2]
+        ).reshape(-1, _RULE_ROW)
+        self.pair_rows = frombuffer(
+            self._map, dtype=int32, count=num_pairs * _PAIR_ROW, offset=starts[3]
+        ).reshape(-1, _PAIR_ROW)
+        self.token_ids = frombuffer(self._map, dtype=int32, count=num_tokens, offset=starts[4])
+        self.action_codes = frombuffer(
+            self._map, dtype=int32, count=num_actions, offset=starts[5]
+        )
+
+    def is_current(self, rules_filepath: str) -> bool:
+        """
+        Whether the file was compiled from the current contents of the benchmark JSON file, with
+        the installed version of the tokenizer.
+        """
+        return (
+            source_hash(rules_filepath) == self.source_hash
+            and self.tokenizer_version == tokenizer_version()
+        )
+
+    def _string(self, string_id: int) -> Optional[str]:
+        return None if string_id == _NONE else self.strings[string_id]
+
+    def rules(self) -> RulesContainer:
+        """Build the RulesContainer of the benchmark."""
+        strings = self._string
+        rules = {}
+        num_fields = len(_EXAMPLE_FIELDS)
+        for row in self.rule_rows.tolist():
+            fields = dict(zip(_RULE_FIELDS, map(strings, row[1 : 1 + len(_RULE_FIELDS)])))
+            examples = []
+            for start in range(1 + len(_RULE_FIELDS), _RULE_ROW, num_fields):
+                example_row = row[start : start + num_fields]
+                if example_row[0] == _MISSING:
+                    examples.append(None)
+                else:
+                    examples.append(
+                        RuleExample(**dict(zip(_EXAMPLE_FIELDS, map(strings, example_row))))
+                    )
+            rules[strings(row[0])] = SingleRule(examples=examples, **fields)
+        return RulesContainer(rules)
+
+    def populate_index(self, index: BenchmarkTokenIndex) -> int:
+        """
+        Add the precomputed entries of every sentence pair to a benchmark token index.
+
+        The tokens of the file are interned by the index's interner. For a fresh interner they get
+        the ids of the file, and the arrays are used as they are.
+
+        The entries are copied out of the file, so the index stays valid after it is closed.
+
+        Returns the number of entries added, 0 if the index uses a different aligner than the file,
+        or the file was tokenized with a different version of the tokenizer.
+        """
+        if index.aligner != self.aligner or self.tokenizer_version != tokenizer_version():
+            return 0
+        strings = self.strings
+        token_map = index.interner.intern_all(strings[: self.num_token_strings])
+        token_ids = array("i", self.token_ids.tobytes())
+        action_codes = array("i", self.action_codes.tobytes())
+        if token_map != array("i", range(len(token_map))):
+            token_ids = array("i", [token_map[i] for i in token_ids])
+            action_codes = array(
+                "i",
+                [
+                    token_map[code >> _TAG_BITS] << _TAG_BITS | code & _TAG_MASK
+                    for code in action_codes
+                ],
+            )
+        for input_id, reference_id, t_start, t_end, a_start, a_end in self.pair_rows.tolist():
+            entry = _ExpectedTokens(token_ids[t_start:t_end], action_codes[a_start:a_end])
+            index.insert(strings[input_id], strings[reference_id], entry)
+        return len(self.pair_rows)
+
+    def close(self) -> None:
+        # drop the views of the map before closing it
+        self.rule_rows = self.pair_rows = None
+        self.token_ids = self.action_codes = None
+        self._map.close()
+
+    def __enter__(self) -> "CompiledBenchmark":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def load_benchmark(
+    filepath: str, aligner: Union[str, Callable] = None
+) -> Tuple[RulesContainer, Optional[BenchmarkTokenIndex]]:
+    """
+    Load a benchmark from a JSON file or a compiled benchmark file.
+
+    For a compiled file, a benchmark token index prefilled with the precomputed entries is returned
+    along with the rules, if it was compiled with the given aligner and the installed version of
+    the tokenizer. Otherwise the index is None, and is built on demand during the evaluation.
+
+    Returns:
+        Tuple[RulesContainer, Optional[BenchmarkTokenIndex]]: The rules and the prefilled index.
+    """
+    if not is_compiled_benchmark(filepath):
+        return load_rules_json(filepath), None
+    with CompiledBenchmark(filepath) as compiled:
+        rules = compiled.rules()
+        if (aligner or DEFAULT_ALIGNER) != compiled.aligner:
+            return rules, None
+        if compiled.tokenizer_version != tokenizer_version():
+            logger.warning(
+                f"{filepath} was compiled with tokenizer {compiled.tokenizer_version}, not "
+                f"{tokenizer_version()}, so its sentences are tokenized again, please recompile it"
+            )
+            return rules, None
+        index = BenchmarkTokenIndex(aligner=compiled.aligner)
+        compiled.populate_index(index)
+    return rules, index
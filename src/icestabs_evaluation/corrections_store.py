@@ -0,0 +1,171 @@
+import json
+import os
+import re
+import tempfile
+import threading
+from typing import Iterable, List, Optional
+from pandas import DataFrame, read_parquet
+from . import IceStaBSEvalException
+
+
+_MANIFEST = "manifest.json"
+_STORE_VERSION = 1
+
+
+def _require_pyarrow() -> None:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise IceStaBSEvalException(
+            "The corrections store requires pyarrow, install it with: pip install 'icestabs_evaluation[store]'"
+        ) from None
+
+
+def _column_file_name(column: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", column) + ".parquet"
+
+
+class CorrectionsStore:
+    """
+    A columnar, append-friendly store of corrections, as an alternative to a single corrections TSV file.
+
+    Every column ('rule', 'ex_1_original', 'ex_1_greynir', ...) is stored in its own Parquet file in the
+    store directory, and a JSON manifest lists the columns in order. Writing a column only writes that
+    column's file and the manifest, both atomically (write to a temporary file, then rename), so a new
+    tool output never touches the other columns and an interrupted write never leaves a broken store.
+    Reading only loads the requested columns.
+
+    Requires pyarrow, which is installed with the 'store' extra.
+
+    Attributes:
+        path (str): Path to the store directory, created if it does not exist.
+    """
+
+    def __init__(self, path: str):
+        _require_pyarrow()
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._manifest = self._read_manifest()
+
+    def _read_manifest(self) -> dict:
+        manifest_path = os.path.join(self.path, _MANIFEST)
+        if not os.path.exists(manifest_path):
+            return {"version": _STORE_VERSION, "num_rows": None, "columns": {}}
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != _STORE_VERSION:
+            raise IceStaBSEvalException(
+                f"Unsupported corrections store version {manifest.get('version')} in {self.path}"
+            )
+        return manifest
+
+    def _replace_atomically(self, file_name: str, write) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=f".{file_name}.")
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, os.path.join(self.path, file_name))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _write_manifest(self) -> None:
+        def write(tmp_path):
+            with open(tmp_path, "w") as f:
+                json.dump(self._manifest, f, ensure_ascii=False, indent=2)
+
+        self._replace_atomically(_MANIFEST, write)
+
+    @property
+    def columns(self) -> List[str]:
+        """The columns of the store, in the order they were added."""
+        return list(self._manifest["columns"])
+
+    @property
+    def num_rows(self) -> Optional[int]:
+        return self._manifest["num_rows"]
+
+    def __contains__(self, column: str) -> bool:
+        return column in self._manifest["columns"]
+
+    def write_column(self, column: str, values: Iterable) -> None:
+        """
+        Write a column to the store, replacing it if it exists.
+
+        Raises:
+            IceStaBSEvalException: If the number of values does not match the other columns.
+        """
+        values = list(values)
+        with self._lock:
+            if self.num_rows is not None and len(values) != self.num_rows:
+                raise IceStaBSEvalException(
+                    f"Column {column} has {len(values)} rows, the corrections store has {self.num_rows}"
+                )
+            file_name = _column_file_name(column)
+            self._replace_atomically(
+                file_name,
+                lambda tmp_path: DataFrame({column: values}).to_parquet(
+                    tmp_path, engine="pyarrow", index=False
+                ),
+            )
+            self._manifest["num_rows"] = len(values)
+            self._manifest["columns"][column] = file_name
+            self._write_manifest()
+
+    def drop_column(self, column: str) -> None:
+        """
+        Remove a column from the store, if it exists.
+
+        Removing the last column also forgets the number of rows, so the store can be rewritten
+        with columns of another length, e.g. after a benchmark edit.
+        """
+        with self._lock:
+            file_name = self._manifest["columns"].pop(column, None)
+            if file_name is None:
+                return
+            if not self._manifest["columns"]:
+                self._manifest["num_rows"] = None
+            self._write_manifest()
+            os.remove(os.path.join(self.path, file_name))
+
+    def read(self, columns: Optional[List[str]] = None) -> DataFrame:
+        """
+        Read columns of the store into a corrections DataFrame.
+
+        Args:
+            columns (List[str], optional): The columns to read, in order. Defaults to all the columns.
+        Returns:
+            DataFrame: A DataFrame with the requested columns.
+        Raises:
+            KeyError: If a requested column is not in the store.
+        """
+        if columns is None:
+            columns = self.columns
+        missing = [column for column in columns if column not in self]
+        if missing:
+            raise KeyError(f"Columns not found in the corrections store: {missing}")
+        return DataFrame(
+            {
+                column: read_parquet(
+                    os.path.join(self.path, self._manifest["columns"][column]),
+                    engine="pyarrow",
+                )[column].to_numpy()
+                for column in columns
+            }
+        )
+
+    @classmethod
+    def from_dataframe(cls, path: str, corrections: DataFrame) -> "CorrectionsStore":
+        """Create (or update) a store at the given path, with the columns of a corrections DataFrame."""
+        store = cls(path)
+        for column in corrections.columns:
+            if column == "Unnamed: 0":
+                continue
+            store.write_column(column, corrections[column])
+        return store
+
+    def to_tsv(self, filepath: str) -> None:
+        """Export the whole store as a corrections TSV file, for tools that read the TSV format."""
+        self.read().to_csv(filepath, sep="\t", index=True)
@@ -0,0 +1,235 @@
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Union
+from pandas import DataFrame
+from . import RulesContainer
+from .statistics import (
+    data_from_tsv,
+    build_overview_data,
+    generate_summary_table,
+    generate_per_rule_table,
+    leaderboard_from_per_rule_table,
+    f_score_per_tool,
+    fast_path_per_tool,
+    get_tool_columns,
+    is_tool_column,
+)
+from .corrections_store import CorrectionsStore
+from .score_cache import ScoreCache
+from .token_level_eval import BenchmarkTokenIndex
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EvaluationTables:
+    overview: DataFrame  # one row per (rule, example, tool), see build_overview_data
+    summary: DataFrame  # sentence level scores per tool and example, see generate_summary_table
+    per_rule: DataFrame  # sentence level scores per rule chapter and tool, see generate_per_rule_table
+    leaderboard: DataFrame  # the best tool per rule chapter, see leaderboard_from_per_rule_table
+    f1_scores: DataFrame  # token level precision, recall and F1 score per tool, see f_score_per_tool
+    fast_path: DataFrame  # fast path hits per tool, see fast_path_per_tool
+
+
+def evaluate_corrections(
+    corrections: DataFrame,
+    workers: int = 1,
+    aligner: Union[str, Callable] = None,
+    benchmark_index: Optional[BenchmarkTokenIndex] = None,
+    score_cache: Optional[ScoreCache] = None,
+) -> EvaluationTables:
+    """
+    Evaluate all the tools in a corrections DataFrame in a single pass.
+
+    The benchmark side is tokenized once and every cell is scored once, and all the tables
+    are derived from the resulting overview DataFrame.
+
+    Args:
+        corrections (DataFrame): The corrections DataFrame, with columns in the format 'ex_{example_nr}_{tool_name}'.
+        workers (int): Number of worker processes used for scoring.
+        aligner (str or callable, optional): The token alignment backend.
+        benchmark_index (BenchmarkTokenIndex, optional): A precomputed benchmark token index.
+        score_cache (ScoreCache, optional): A persistent score cache, so that only new or changed cells are scored.
+    Returns:
+        EvaluationTables: The overview and the summary, per rule, leaderboard, F1 and fast path tables.
+    """
+    overview = build_overview_data(
+        corrections,
+        benchmark_index=benchmark_index,
+        workers=workers,
+        aligner=aligner,
+        score_cache=score_cache,
+    )
+    per_rule = generate_per_rule_table(overview)
+    return EvaluationTables(
+        overview=overview,
+        summary=generate_summary_table(overview),
+        per_rule=per_rule,
+        leaderboard=leaderboard_from_per_rule_table(per_rule),
+        f1_scores=f_score_per_tool(overview),
+        fast_path=fast_path_per_tool(overview),
+    )
+
+
+def format_leaderboard_tables(tables: EvaluationTables) -> Dict[str, DataFrame]:
+    """
+    Format the evaluation tables of many tools as a combined leaderboard, for display or writing to disk.
+
+    Returns:
+        Dict[str, DataFrame]: The sentence level scores per tool and example, the token level F1 scores,
+            the scores per rule chapter, the best tool per rule chapter and the fast path hits per tool.
+    """
+    summary_table = tables.summary.sort_values(by="Percentage", ascending=False)
+    summary_table = summary_table.reset_index(inplace=False)
+    summary_table = summary_table.rename(
+        columns={
+            "Total_Count": "total_correct",
+            "ex_1": "ex_1_correct",
+            "ex_2": "ex_2_correct",
+            "ex_3": "ex_3_correct",
+        }
+    )
+
+    f1_scores_table = tables.f1_scores.sort_values(by="f1_score", ascending=False)
+
+    per_rule_table = tables.per_rule.reset_index(inplace=False)
+    per_rule_table = per_rule_table.rename(columns={"Total": "total_possible"})
+
+    return {
+        "Score per example": summary_table,
+        "F1 scores per tool": f1_scores_table,
+        "Score per rule chapter": per_rule_table,
+        "Per-rule leaderboard": tables.leaderboard,
+        "Fast path hits per tool": tables.fast_path,
+    }
+
+
+def write_tables(tables: Dict[str, DataFrame], output_dir: str) -> List[str]:
+    """
+    Write tables to TSV files in a directory, named after the table names, e.g. 'score_per_example.tsv'.
+
+    Returns:
+        List[str]: The paths of the written files.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    for table_name, table in tables.items():
+        file_name = re.sub(r"[^a-z0-9]+", "_", table_name.lower()).strip("_")
+        filepath = os.path.join(output_dir, f"{file_name}.tsv")
+        table.to_csv(filepath, sep="\t", index=False)
+        written.append(filepath)
+    return written
+
+
+def config_data_dir(config: dict, config_filepath: str) -> str:
+    """
+    Get the data directory of an evaluation config, like M14-Eval/M14-eval-config.yml.
+
+    The directory is FILE_FOLDERS.data_dir under FILE_FOLDERS.base_dir. If that does not exist,
+    e.g. when the config was written on another machine, it is resolved relative to the config file.
+    """
+    folders = config.get("FILE_FOLDERS", {})
+    data_dir = folders.get("data_dir", "data")
+    base_dir = folders.get("base_dir")
+    if base_dir and os.path.isdir(os.path.join(base_dir, data_dir)):
+        return os.path.join(base_dir, data_dir)
+    return os.path.join(os.path.dirname(os.path.abspath(config_filepath)), data_dir)
+
+
+def load_config_corrections(
+    config: dict, config_filepath: str, rules: Optional[RulesContainer] = None
+) -> DataFrame:
+    """
+    Load the outputs of all the tools in an evaluation config into a corrections DataFrame.
+
+    The outputs are read from the corrections store (OUTPUT_FILES.corrections_store) in the data directory,
+    reading only the columns of the configured tools, or else from the corrections TSV file (OUTPUT_FILES.corrections).
+    Tools of the config that are missing from the TSV file are read from their per-example files
+    in the 'output_manual' directory, if they exist. If there is no TSV file, all the outputs are read
+    from the per-example files, which requires the benchmark rules.
+
+    Args:
+        config (dict): The evaluation config, see load_config_yaml.
+        config_filepath (str): Path to the config file, used to resolve relative paths.
+        rules (RulesContainer, optional): The benchmark rules.
+    Returns:
+        DataFrame: The corrections DataFrame, with the tool columns of the configured tools.
+
+    Raises:
+        FileNotFoundError: If there is no corrections TSV file and no rules were given.
+    """
+    from .batch import benchmark_frame, discover_output_files, load_output_files
+
+    data_dir = config_data_dir(config, config_filepath)
+    tools = [
+        tool_info.get("id", tool)
+        for tool, tool_info in config.get("GLOBALS", {}).get("tools", {}).items()
+    ]
+    corrections_file = config.get("OUTPUT_FILES", {}).get("corrections")
+    corrections_path = (
+        os.path.join(data_dir, corrections_file) if corrections_file else None
+    )
+    manual_files = discover_output_files([os.path.join(data_dir, "output_manual")])
+
+    store_dir = config.get("OUTPUT_FILES", {}).get("corrections_store")
+    store_path = os.path.join(data_dir, store_dir) if store_dir else None
+
+    if store_path and os.path.exists(os.path.join(store_path, "manifest.json")):
+        logger.info(f"Loading corrections from the corrections store {store_path}")
+        store = CorrectionsStore(store_path)
+        # only read the benchmark columns and the columns of the configured tools
+        columns = [
+            col_name
+            for col_name in store.columns
+            if not is_tool_column(col_name)
+            or "_".join(col_name.split("_")[2:]) in tools
+        ]
+        corrections = store.read(columns)
+    elif corrections_path and os.path.exists(corrections_path):
+        logger.info(f"Loading corrections from {corrections_path}")
+        corrections = data_from_tsv(corrections_path)
+        if "Unnamed: 0" in corrections.columns:
+            corrections = corrections.drop(columns=["Unnamed: 0"])
+        missing_tools = [
+            tool
+            for tool in tools
+            if not any(
+                col_name == f"ex_{set_nr}_{tool}"
+                for col_name in corrections.columns
+                for set_nr in range(1, 4)
+            )
+        ]
+        missing_files = [
+            filepath
+            for filepath in manual_files
+            if any(
+                os.path.basename(filepath).startswith(f"ex_{set_nr}_{tool}.")
+                for tool in missing_tools
+                for set_nr in range(1, 4)
+            )
+        ]
+        if missing_files:
+            corrections = load_output_files(missing_files, corrections)
+    elif rules is not None:
+        logger.info(f"Loading per-tool output files from {data_dir}")
+        corrections = load_output_files(manual_files, benchmark_frame(rules))
+    else:
+        raise FileNotFoundError(
+            f"The corrections file was not found at {corrections_path}, and no benchmark rules were given to evaluate the per-tool output files."
+        )
+
+    # only evaluate the tools of the config
+    tool_columns = [
+        col_name
+        for col_name in get_tool_columns(corrections)
+        if "_".join(col_name.split("_")[2:]) in tools
+    ]
+    other_columns = [
+        col_name
+        for col_name in corrections.columns
+        if col_name not in get_tool_columns(corrections)
+    ]
+    return corrections[other_columns + tool_columns]
@@ -0,0 +1,208 @@
+"""
+Timing instrumentation of the evaluation pipeline.
+
+The stages of the pipeline (loading, tokenization, alignment, action comparison, building the tables
+and rendering them) are wrapped in ``stage`` blocks, which do nothing unless a profiler is active:
+
+    with profiling() as profiler:
+        evaluate_corrections(corrections)
+    profiler.write_json("profile.json")
+    profiler.write_chrome_trace("profile.trace.json")
+
+For every (stage, tool) the profiler records the number of calls, the number of items processed
+(e.g. sentences), the wall time, the CPU time, and the self time, i.e. the wall time spent outside
+nested stages. A stage without a tool is attributed to the tool of the enclosing stage, if any.
+Every call is also kept as an event for the Chrome trace, which shows the nesting of the stages
+on a timeline (open it in chrome://tracing or https://ui.perfetto.dev).
+
+Stages run in worker processes (``--jobs`` above 1) are not recorded, only the total scoring time.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass
+from functools import wraps
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    items: int = 0
+    wall_time: float = 0.0  # seconds, including nested stages
+    cpu_time: float = 0.0  # seconds of process CPU time, including nested stages
+    self_time: float = 0.0  # seconds of wall time, excluding nested stages
+
+
+class Profiler:
+    """
+    Records the wall time, CPU time and call counts of the pipeline stages, see stage.
+
+    Attributes:
+        stats (Dict[Tuple[str, Optional[str]], StageStats]): The totals of each (stage, tool), in order of first call.
+        events (List[dict]): One Chrome trace event per stage call, if trace is enabled.
+        trace (bool): Whether to keep the events of the individual calls.
+    """
+
+    def __init__(self, trace: bool = True):
+        self.trace = trace
+        self.stats: Dict[Tuple[str, Optional[str]], StageStats] = {}
+        self.events: List[dict] = []
+        self._origin = time.perf_counter()
+        self._wall_end = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self) -> List[list]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def stage(self, name: str, tool: Optional[str] = None, items: int = 1) -> Iterator[None]:
+        """Record the time spent in the block as a call of the stage."""
+        stack = self._stack()
+        if tool is None and stack:
+            tool = stack[-1][0]
+        # the tool of the frame, and the wall time of its nested stages
+        frame = [tool, 0.0]
+        stack.append(frame)
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - wall_start
+            cpu_time = time.process_time() - cpu_start
+            stack.pop()
+            if stack:
+                stack[-1][1] += wall_time
+            with self._lock:
+                stats = self.stats.setdefault((name, tool), StageStats())
+                stats.calls += 1
+                stats.items += items
+                stats.wall_time += wall_time
+                stats.cpu_time += cpu_time
+                stats.self_time += wall_time - frame[1]
+                if self.trace:
+                    args = {"items": items, "cpu_ms": round(cpu_time * 1000, 3)}
+                    if tool is not None:
+                        args["tool"] = tool
+                    self.events.append(
+                        {
+                            "name": name,
+                            "cat": "stage",
+                            "ph": "X",
+                            "ts": (wall_start - self._origin) * 1e6,
+                            "dur": wall_time * 1e6,
+                            "pid": os.getpid(),
+                            "tid": threading.get_ident(),
+                            "args": args,
+                        }
+                    )
+
+    def stop(self) -> None:
+        self._wall_end = time.perf_counter()
+
+    @property
+    def wall_time(self) -> float:
+        """The wall time since the profiler was created, until it was stopped."""
+        end = self._wall_end if self._wall_end is not None else time.perf_counter()
+        return end - self._origin
+
+    def to_dict(self) -> dict:
+        """The totals of every (stage, tool), as a JSON serializable dict."""
+        return {
+            "wall_time": self.wall_time,
+            "stages": [
+                {"stage": name, "tool": tool, **asdict(stats)}
+                for (name, tool), stats in self.stats.items()
+            ],
+        }
+
+    def to_chrome_trace(self) -> dict:
+        """The stage calls in the Chrome trace event format."""
+        return {"traceEvents": self.events, "displayTimeUnit": "ms"}
+
+    def write_json(self, filepath: str) -> None:
+        import json
+
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    def write_chrome_trace(self, filepath: str) -> None:
+        import json
+
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False)
+
+    def format_table(self) -> str:
+        """The totals of every (stage, tool) as a markdown table, slowest self time first."""
+        lines = [
+            "| stage | tool | calls | items | wall (ms) | self (ms) | cpu (ms) |",
+            "|---|---|---|---|---|---|---|",
+        ]
+        for (name, tool), stats in sorted(
+            self.stats.items(), key=lambda item: item[1].self_time, reverse=True
+        ):
+            lines.append(
+                f"| {name} | {tool or ''} | {stats.calls} | {stats.items} "
+                f"| {stats.wall_time * 1000:.1f} | {stats.self_time * 1000:.1f} "
+                f"| {stats.cpu_time * 1000:.1f} |"
+            )
+        lines.append(f"\nTotal wall time: {self.wall_time * 1000:.1f} ms")
+        return "\n".join(lines)
+
+
+# the profiler that stage records into, None when profiling is off
+_ACTIVE: Optional[Profiler] = None
+_NO_STAGE = nullcontext()
+
+
+def stage(name: str, tool: Optional[str] = None, items: int = 1):
+    """
+    Context manager recording a block as a call of a pipeline stage, if a profiler is active.
+
+    Args:
+        name (str): Name of the stage, e.g. 'tokenize'.
+        tool (str, optional): The tool the stage is run for. Defaults to the tool of the enclosing stage.
+        items (int): Number of items (e.g. sentences) processed by the call.
+    """
+    if _ACTIVE is None:
+        return _NO_STAGE
+    return _ACTIVE.stage(name, tool=tool, items=items)
+
+
+def profiled(name: str) -> Callable[[Callable], Callable]:
+    """Decorator recording every call of a function as a call of the given stage."""
+
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def is_profiling() -> bool:
+    return _ACTIVE is not None
+
+
+@contextmanager
+def profiling(trace: bool = True) -> Iterator[Profiler]:
+    """Record the pipeline stages run in the block with a new profiler."""
+    global _ACTIVE
+    previous = _ACTIVE
+    profiler = Profiler(trace=trace)
+    _ACTIVE = profiler
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _ACTIVE = previous
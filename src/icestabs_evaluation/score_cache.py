@@ -0,0 +1,97 @@
+import sqlite3
+from hashlib import sha256
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+from .token_level_eval import tokenizer_version
+
+
+# bump when a change to the scoring changes the token level scores of any output
+SCORER_VERSION = "1"
+
+# number of keys per SQLite query, well below the limit on query parameters
+_QUERY_CHUNK_SIZE = 500
+
+_Scores = Tuple[int, int, int, int]
+
+
+def _aligner_name(aligner: Union[str, Callable]) -> str:
+    if aligner is None or isinstance(aligner, str):
+        return aligner or ""
+    return f"{aligner.__module__}.{aligner.__qualname__}"
+
+
+class ScoreCache:
+    """
+    A persistent on-disk cache of token level scores, stored in an SQLite file.
+
+    Each entry is keyed by a hash of the (original, output, standardized) sentences, the version of the
+    tokenizer, the scorer version and the alignment backend, and holds the tp, fp, tn and fn scores.
+    Re-evaluating a corrections file then only scores the cells that are new or changed.
+
+    Attributes:
+        path (str): Path to the SQLite file, created if it does not exist.
+        hits (int): Number of cells found in the cache since it was opened.
+        misses (int): Number of cells not found in the cache since it was opened.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._key_prefix = "\x1f".join([tokenizer_version(), SCORER_VERSION])
+        self.hits = 0
+        self.misses = 0
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            "key BLOB PRIMARY KEY, tp INTEGER, fp INTEGER, tn INTEGER, fn INTEGER)"
+        )
+
+    def keys(
+        self,
+        triples: Iterable[Tuple[str, str, str]],
+        aligner: Union[str, Callable] = None,
+    ) -> List[bytes]:
+        """Get the cache keys of many (original, output, standardized) cells, scored with the given aligner."""
+        prefix = "\x1f".join([self._key_prefix, _aligner_name(aligner)])
+        return [
+            sha256("\x1f".join([prefix, *triple]).encode("utf-8")).digest()
+            for triple in triples
+        ]
+
+    def get_many(self, keys: Iterable[bytes]) -> Dict[bytes, _Scores]:
+        """
+        Look up the keys of many cells, and return the scores of the keys found in the cache.
+
+        Each distinct key is looked up once, but the hits and misses count every cell, so a key
+        repeated for identical cells counts once per cell.
+        """
+        keys = list(keys)
+        unique_keys = list(dict.fromkeys(keys))
+        found = {}
+        for start in range(0, len(unique_keys), _QUERY_CHUNK_SIZE):
+            chunk = unique_keys[start : start + _QUERY_CHUNK_SIZE]
+            rows = self._connection.execute(
+                f"SELECT key, tp, fp, tn, fn FROM scores WHERE key IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            for key, *scores in rows:
+                found[key] = tuple(scores)
+        hits = sum(key in found for key in keys)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, items: Iterable[Tuple[bytes, _Scores]]) -> None:
+        """Store the scores of many keys."""
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO scores (key, tp, fp, tn, fn) VALUES (?, ?, ?, ?, ?)",
+                [(key, *map(int, scores)) for key, scores in items],
+            )
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "ScoreCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -1,9 +1,23 @@
-from pandas import DataFrame, read_csv, pivot_table, concat
+from pandas import DataFrame, read_csv, pivot_table
 from collections import defaultdict
-from .token_level_eval import token_level_eval
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import fields
+from numpy import array, column_stack, concatenate, empty, int64, ndarray
+from typing import Callable, List, Optional, Tuple, Union
+from .profiling import is_profiling, profiled, stage
+from .score_cache import ScoreCache
+from .token_level_eval import token_level_eval_many, BenchmarkTokenIndex
 from . import _StatOverview
 
+# the columns of the overview DataFrame, in the order of the _StatOverview fields
+OVERVIEW_COLUMNS = [field.name for field in fields(_StatOverview)]
+# the token level score columns, in the order of the EvaluationResults fields
+_SCORE_COLUMNS = ["tp_score", "fp_score", "tn_score", "fn_score"]
+# number of chunks per worker process when scoring in parallel
+_CHUNKS_PER_WORKER = 4
 
+
+@profiled("load_outputs")
 def data_from_tsv(filepath: str) -> DataFrame:
     """
     Read a TSV file into a DataFrame.
@@ -16,6 +30,22 @@ def data_from_tsv(filepath: str) -> DataFrame:
         return DataFrame()
 
 
+@profiled("load_outputs")
+def data_from_store(path: str, columns: Optional[List[str]] = None) -> DataFrame:
+    """
+    Read a corrections store into a DataFrame, reading only the given columns.
+
+    Args:
+        path (str): Path to the corrections store directory, see CorrectionsStore.
+        columns (List[str], optional): The columns to read. Defaults to all the columns.
+    Returns:
+        DataFrame: A DataFrame with the requested columns.
+    """
+    from .corrections_store import CorrectionsStore
+
+    return CorrectionsStore(path).read(columns)
+
+
 def data_from_dict(data: dict) -> DataFrame:
     """
     Read a dictionary into a DataFrame.
@@ -48,79 +78,301 @@ def data_from_dict(data: dict) -> DataFrame:
         raise e
 
 
-def build_overview_data(corrections: DataFrame) -> DataFrame:
-    overview_data = []
-    for col_name in corrections.columns:
-        if col_name.startswith("ex_"):
-            if col_name.endswith("standardized") or col_name.endswith("original"):
-                continue
-            example_nr = col_name.split("_")[1]
-            example_id = "_".join(col_name.split("_")[:2])
-            tool = "_".join(col_name.split("_")[2:])
-            for i, row in corrections.iterrows():
-                standardized_label = f"ex_{example_nr}_standardized"
-                original_label = f"ex_{example_nr}_original"
-                token_level_stats = token_level_eval(
-                    row[original_label],
-                    row[col_name],
-                    row[standardized_label],
-                )
-                single_output_data = _StatOverview(
-                    rule=row["rule"],
-                    tool=tool,
-                    example_id=example_id,
-                    input_text=row[original_label],
-                    output_text=row[col_name],
-                    correct=row[standardized_label],
-                    tp_score=token_level_stats.true_positive,
-                    fp_score=token_level_stats.false_positive,
-                    tn_score=token_level_stats.true_negative,
-                    fn_score=token_level_stats.false_negative,
-                    sent_level_correct=(
-                        1 if row[col_name] == row[standardized_label] else 0
-                    ),
-                )
-                overview_data.append(single_output_data)
-    overview_df = DataFrame([vars(x) for x in overview_data])
-    return overview_df
+def get_tool_columns(corrections: DataFrame) -> List[str]:
+    """
+    Get the tool output columns of a corrections DataFrame, i.e. the 'ex_{example_nr}_{tool_name}'
+    columns that are not the original or standardized sentences.
+    """
+    return [col_name for col_name in corrections.columns if is_tool_column(col_name)]
 
 
-def f_score_per_tool(df: DataFrame) -> DataFrame:
+def is_tool_column(col_name: str) -> bool:
+    """Whether a corrections column holds tool outputs, i.e. is 'ex_{example_nr}_{tool_name}'."""
+    return col_name.startswith("ex_") and not (
+        col_name.endswith("standardized") or col_name.endswith("original")
+    )
+
+
+def build_benchmark_index(
+    corrections: DataFrame, aligner: Union[str, Callable] = None
+) -> BenchmarkTokenIndex:
     """
-    Calculate the F1 score for each tool in the DataFrame.
+    Build the token index of the benchmark sentences in a corrections DataFrame.
+
+    Args:
+        corrections (DataFrame): A DataFrame with 'ex_{example_nr}_original' and 'ex_{example_nr}_standardized' columns.
+        aligner (str or callable, optional): The alignment backend used for the expected actions. Defaults to 'difflib'.
+    Returns:
+        BenchmarkTokenIndex: The tokenized original sentences and expected actions for each (rule, example).
     """
-    # create a new DataFrame to store the results
-    f1_scores = DataFrame(columns=["tool", "precision", "recall", "f1_score"])
-    # sum the true positive, false positive and false negative scores for each tool
-    for tool in df["tool"].unique():
-        if tool in ["standardized, original"]:
+    benchmark_index = BenchmarkTokenIndex(aligner=aligner)
+    for col_name in corrections.columns:
+        if not (col_name.startswith("ex_") and col_name.endswith("_original")):
             continue
-        tool_df = df[df["tool"] == tool]
-        tp = tool_df["tp_score"].sum()
-        fp = tool_df["fp_score"].sum()
-        fn = tool_df["fn_score"].sum()
-        # calculate the precision, recall and F1 score
-        precision = tp / (tp + fp) if tp + fp > 0 else 0
-        recall = tp / (tp + fn) if tp + fn > 0 else 0
-        f1_score = (
-            2 * (precision * recall) / (precision + recall)
-            if precision + recall > 0
-            else 0
+        example_nr = col_name.split("_")[1]
+        standardized_label = f"ex_{example_nr}_standardized"
+        for original, standardized in zip(
+            corrections[col_name], corrections[standardized_label]
+        ):
+            benchmark_index.get(original, standardized)
+    return benchmark_index
+
+
+def _score_chunk(
+    input_texts: List[str],
+    output_texts: List[str],
+    correct_texts: List[str],
+    benchmark_index: BenchmarkTokenIndex,
+) -> ndarray:
+    return column_stack(
+        token_level_eval_many(
+            input_texts, output_texts, correct_texts, benchmark_index=benchmark_index
+        )
+    )
+
+
+# the benchmark index of a worker process, set once by the pool initializer
+_WORKER_INDEX: Optional[BenchmarkTokenIndex] = None
+
+
+def _init_worker(benchmark_index: BenchmarkTokenIndex) -> None:
+    global _WORKER_INDEX
+    _WORKER_INDEX = benchmark_index
+
+
+def _score_chunk_in_worker(chunk: Tuple[List[str], List[str], List[str]]) -> ndarray:
+    return _score_chunk(*chunk, benchmark_index=_WORKER_INDEX)
+
+
+def _score_chunk_per_tool(
+    input_texts: List[str],
+    output_texts: List[str],
+    correct_texts: List[str],
+    tools: List[str],
+    benchmark_index: BenchmarkTokenIndex,
+) -> ndarray:
+    # only used when profiling, so that the scoring stages are recorded for each tool
+    cells_per_tool = defaultdict(list)
+    for i, tool in enumerate(tools):
+        cells_per_tool[tool].append(i)
+    scores = empty((len(input_texts), len(_SCORE_COLUMNS)), dtype=int64)
+    for tool, cells in cells_per_tool.items():
+        with stage("score", tool=tool, items=len(cells)):
+            scores[cells] = _score_chunk(
+                [input_texts[i] for i in cells],
+                [output_texts[i] for i in cells],
+                [correct_texts[i] for i in cells],
+                benchmark_index,
+            )
+    return scores
+
+
+def score_cells(
+    input_texts: List[str],
+    output_texts: List[str],
+    correct_texts: List[str],
+    benchmark_index: BenchmarkTokenIndex,
+    workers: int = 1,
+    score_cache: Optional[ScoreCache] = None,
+    tools: Optional[List[str]] = None,
+) -> ndarray:
+    """
+    Calculate the token level scores for aligned lists of input, output and expected sentences.
+
+    Args:
+        input_texts (List[str]): The original sentences.
+        output_texts (List[str]): The tool outputs.
+        correct_texts (List[str]): The standardized sentences.
+        benchmark_index (BenchmarkTokenIndex): The benchmark token index shared by all cells.
+        workers (int): Number of worker processes. With more than one worker the cells are split
+            into contiguous chunks that are scored in a process pool and merged in their original order,
+            so the result is identical to the serial one.
+        score_cache (ScoreCache, optional): A persistent score cache. Only the cells that are not in the
+            cache are scored, and their scores are added to the cache.
+        tools (List[str], optional): The tool of each cell, to record the scoring time of each tool
+            when profiling (see the profiling module).
+    Returns:
+        ndarray: An (n, 4) integer array with the tp, fp, tn and fn scores of each cell.
+    """
+    if score_cache is None:
+        return _score_cells(
+            input_texts, output_texts, correct_texts, benchmark_index, workers, tools
+        )
+
+    with stage("score_cache", items=len(input_texts)):
+        keys = score_cache.keys(
+            zip(input_texts, output_texts, correct_texts), aligner=benchmark_index.aligner
+        )
+        scores = score_cache.get_many(keys)
+    missing = [i for i, key in enumerate(keys) if key not in scores]
+    if missing:
+        missing_scores = _score_cells(
+            [input_texts[i] for i in missing],
+            [output_texts[i] for i in missing],
+            [correct_texts[i] for i in missing],
+            benchmark_index,
+            workers,
+            [tools[i] for i in missing] if tools is not None else None,
         )
-        # append the results to the new DataFrame
-        new_row = DataFrame(
-            {
-                "tool": [tool],
-                "precision": [precision],
-                "recall": [recall],
-                "f1_score": [f1_score],
-            }
+        new_scores = {
+            keys[i]: tuple(cell_scores) for i, cell_scores in zip(missing, missing_scores)
+        }
+        with stage("score_cache", items=len(new_scores)):
+            score_cache.put_many(new_scores.items())
+        scores.update(new_scores)
+    return array([scores[key] for key in keys], dtype=int64).reshape(
+        len(keys), len(_SCORE_COLUMNS)
+    )
+
+
+def _score_cells(
+    input_texts: List[str],
+    output_texts: List[str],
+    correct_texts: List[str],
+    benchmark_index: BenchmarkTokenIndex,
+    workers: int,
+    tools: Optional[List[str]] = None,
+) -> ndarray:
+    if workers is None or workers <= 1 or len(input_texts) < 2:
+        if tools is not None and is_profiling():
+            return _score_chunk_per_tool(
+                input_texts, output_texts, correct_texts, tools, benchmark_index
+            )
+        with stage("score", items=len(input_texts)):
+            return _score_chunk(input_texts, output_texts, correct_texts, benchmark_index)
+
+    # fill the benchmark index before it is sent to the workers, so each pair is only tokenized once
+    pairs = set(zip(input_texts, correct_texts))
+    with stage("benchmark", items=len(pairs)):
+        for input_text, correct in pairs:
+            benchmark_index.get(input_text, correct)
+
+    # a few chunks per worker, to even out the load between the processes
+    chunk_size = -(-len(input_texts) // (workers * _CHUNKS_PER_WORKER))
+    chunks = [
+        (
+            input_texts[start : start + chunk_size],
+            output_texts[start : start + chunk_size],
+            correct_texts[start : start + chunk_size],
         )
-        f1_scores = concat([f1_scores, new_row], ignore_index=True)
+        for start in range(0, len(input_texts), chunk_size)
+    ]
+    with stage("score", items=len(input_texts)), ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(benchmark_index,)
+    ) as executor:
+        # map() returns the results in the order of the chunks
+        return concatenate(list(executor.map(_score_chunk_in_worker, chunks)))
+
+
+@profiled("overview")
+def build_overview_data(
+    corrections: DataFrame,
+    benchmark_index: Optional[BenchmarkTokenIndex] = None,
+    workers: int = 1,
+    aligner: Union[str, Callable] = None,
+    score_cache: Optional[ScoreCache] = None,
+) -> DataFrame:
+    """
+    Build the overview DataFrame, with token and sentence level scores for each (rule, example, tool).
+
+    Args:
+        corrections (DataFrame): The corrections DataFrame, with columns in the format 'ex_{example_nr}_{tool_name}'.
+        benchmark_index (BenchmarkTokenIndex, optional): A precomputed benchmark token index, shared by all tools.
+            Filled on demand from the corrections if not given.
+        workers (int): Number of worker processes used for the token level scoring. Defaults to 1 (serial).
+        aligner (str or callable, optional): The token alignment backend, 'difflib' (default) or 'levenshtein'.
+            Only used when the benchmark index is built here, otherwise the aligner of the index is used.
+        score_cache (ScoreCache, optional): A persistent score cache, so that only new or changed cells are scored.
+    Returns:
+        DataFrame: One row per (rule, example, tool), with the fields of _StatOverview as columns.
+    """
+    if benchmark_index is None:
+        # filled on demand, so that cells found in the score cache never touch the tokenizer
+        benchmark_index = BenchmarkTokenIndex(aligner=aligner)
+    tool_columns = get_tool_columns(corrections)
+    if not tool_columns:
+        return DataFrame(columns=OVERVIEW_COLUMNS)
+
+    # reshape the wide corrections frame into long form, one row per (rule, example, tool)
+    overview_df = corrections.melt(
+        id_vars=["rule"],
+        value_vars=tool_columns,
+        var_name="column",
+        value_name="output_text",
+    )
+    column_parts = overview_df["column"].str.split("_", n=2, expand=True)
+    overview_df["tool"] = column_parts[2]
+    overview_df["example_id"] = "ex_" + column_parts[1]
+    # the melted rows are ordered column by column, so the input and expected sentences
+    # are the matching original and standardized columns stacked in the same order
+    example_nrs = [col_name.split("_")[1] for col_name in tool_columns]
+    overview_df["input_text"] = concatenate(
+        [corrections[f"ex_{nr}_original"].to_numpy() for nr in example_nrs]
+    )
+    overview_df["correct"] = concatenate(
+        [corrections[f"ex_{nr}_standardized"].to_numpy() for nr in example_nrs]
+    )
+    overview_df["sent_level_correct"] = (
+        overview_df["output_text"] == overview_df["correct"]
+    ).astype(int)
+    # vectorized form of token_level_eval.is_fast_path
+    overview_df["fast_path"] = (
+        (overview_df["output_text"] == overview_df["correct"])
+        | (overview_df["output_text"] == overview_df["input_text"])
+    ).astype(int)
+
+    scores = score_cells(
+        overview_df["input_text"].tolist(),
+        overview_df["output_text"].tolist(),
+        overview_df["correct"].tolist(),
+        benchmark_index=benchmark_index,
+        workers=workers,
+        score_cache=score_cache,
+        tools=overview_df["tool"].tolist(),
+    )
+    for i, score_column in enumerate(_SCORE_COLUMNS):
+        overview_df[score_column] = scores[:, i]
 
-    return f1_scores
+    return overview_df[OVERVIEW_COLUMNS]
 
 
+@profiled("f_scores")
+def f_score_per_tool(df: DataFrame) -> DataFrame:
+    """
+    Calculate the F1 score for each tool in the DataFrame.
+    """
+    # sum the true positive, false positive and false negative scores for each tool, in order of appearance
+    sums = df.groupby("tool", sort=False)[["tp_score", "fp_score", "fn_score"]].sum()
+    tp, fp, fn = sums["tp_score"], sums["fp_score"], sums["fn_score"]
+    # calculate the precision, recall and F1 score, as 0 where undefined
+    precision = (tp / (tp + fp)).where(tp + fp > 0, 0.0)
+    recall = (tp / (tp + fn)).where(tp + fn > 0, 0.0)
+    f1_score = (2 * (precision * recall) / (precision + recall)).where(
+        precision + recall > 0, 0.0
+    )
+    return DataFrame(
+        {
+            "tool": sums.index.to_numpy(),
+            "precision": precision.to_numpy(dtype=float),
+            "recall": recall.to_numpy(dtype=float),
+            "f1_score": f1_score.to_numpy(dtype=float),
+        }
+    )
+
+
+@profiled("fast_path_table")
+def fast_path_per_tool(df: DataFrame) -> DataFrame:
+    """
+    Count the cells of each tool that were scored on the fast path, i.e. where the output
+    was identical to the input or the expected sentence.
+    """
+    fast_path = df.groupby("tool", sort=False)["fast_path"].agg(["count", "sum"])
+    fast_path = fast_path.rename(columns={"count": "cells", "sum": "fast_path"})
+    fast_path["fast_path_rate"] = fast_path["fast_path"] / fast_path["cells"]
+    return fast_path.reset_index()
+
+
+@profiled("summary_table")
 def generate_summary_table(df: DataFrame) -> DataFrame:
     # Pivot table to sum up the 'sent_level_correct' values based on 'tool' and 'example_id'
     summary_table = pivot_table(
@@ -141,14 +393,16 @@ def generate_summary_table(df: DataFrame) -> DataFrame:
     return summary_table
 
 
-def generate_per_rule_table(df: DataFrame) -> DataFrame:
-    # Helper function to extract the starting number of the rule
-    def rule_class(rule):
-        # Assuming the rule starts with a number followed by a period
-        return int(rule.split(".")[0])
+def get_rule_class(rule: str) -> int:
+    """Extract the starting number of a rule, i.e. the rule chapter."""
+    # Assuming the rule starts with a number followed by a period
+    return int(rule.split(".")[0])
+
 
+@profiled("per_rule_table")
+def generate_per_rule_table(df: DataFrame) -> DataFrame:
     # Apply the helper function to extract the starting rule number for each row
-    df["rule_class"] = df["rule"].apply(rule_class)
+    df["rule_class"] = df["rule"].apply(get_rule_class)
 
     # Pivot table to sum the 'sent_level_correct' values based on 'rule_class' and 'tool'
     summary_table = pivot_table(
@@ -174,38 +428,26 @@ def generate_per_rule_table(df: DataFrame) -> DataFrame:
     return summary_table
 
 
+@profiled("leaderboard")
 def leaderboard_from_per_rule_table(df: DataFrame) -> DataFrame:
     """Get the highest scoring rules from the per rule table, by comparing to the total column"""
 
-    output_cols = ["rule_class", "best_tool", "score", "possible", "percentage"]
-
-    # Create a new DataFrame to store the results
-    result = DataFrame(columns=output_cols)
-
-    # Iterate through each row in the input DataFrame
-    for index, row in df.iterrows():
-        rule_class = index
-        possible = row["Total"]
-
-        # Find the best tool (excluding 'Total' column)
-        tool_columns = [col for col in df.columns if col != "Total"]
-        best_tool = row[tool_columns].idxmax()
-        score = row[best_tool]
-
-        # Calculate percentage
-        percentage = (score / possible) * 100 if possible > 0 else 0
-
-        # Append the results to the new DataFrame
-        new_row = DataFrame(
-            {
-                "rule_class": [rule_class],
-                "best_tool": [best_tool],
-                "score": [score],
-                "possible": [possible],
-                "percentage": [percentage],
-            }
-        )
-        result = concat([result, new_row], ignore_index=True)
+    # the best tool of each rule class is the first tool with the highest score (excluding 'Total' column)
+    tool_scores = df.drop(columns="Total")
+    best_tool = tool_scores.idxmax(axis=1)
+    score = tool_scores.max(axis=1)
+    possible = df["Total"]
+    percentage = ((score / possible) * 100).where(possible > 0, 0.0)
+
+    result = DataFrame(
+        {
+            "rule_class": df.index.to_numpy(),
+            "best_tool": best_tool.to_numpy(),
+            "score": score.to_numpy(),
+            "possible": possible.to_numpy(),
+            "percentage": percentage.to_numpy(dtype=float),
+        }
+    )
 
     # Sort the result by the rule_class in ascending order
     result = result.sort_values(by="rule_class")
@@ -0,0 +1,176 @@
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Optional, Union
+from pandas import DataFrame
+from . import IceStaBSEvalException, RulesContainer
+from .profiling import stage
+from .statistics import f_score_per_tool, get_rule_class
+from .token_level_eval import BenchmarkTokenIndex, is_fast_path, token_level_eval
+
+
+class StreamingEvaluation:
+    """
+    Running evaluation of the output of a single tool, fed one output line at a time.
+
+    The output lines follow the order of the single file format: first the outputs for example 1 of
+    every rule, then example 2 and example 3. Each line is paired with its benchmark example, scored,
+    and folded into running aggregates, so the memory use does not grow with the size of the output.
+    The tables can be generated at any point, e.g. to report partial results for a truncated file.
+
+    Attributes:
+        tool_name (str): Name of the tool being evaluated.
+        lines_scored (int): Number of output lines scored so far.
+        expected_lines (int): Number of output lines in a complete output file.
+        extra_lines (int): Number of non-empty lines after a complete output, which are not scored.
+    """
+
+    def __init__(
+        self,
+        tool_name: str,
+        rules: RulesContainer,
+        benchmark_index: Optional[BenchmarkTokenIndex] = None,
+        aligner: Union[str, Callable] = None,
+    ):
+        self.tool_name = tool_name
+        self.benchmark_index = (
+            benchmark_index
+            if benchmark_index is not None
+            else BenchmarkTokenIndex(aligner=aligner)
+        )
+        self._rule_keys = list(rules.keys())
+        self._original_examples = rules.get_original_examples()
+        self._standardized_examples = rules.get_standardized_examples()
+        self.expected_lines = len(self._rule_keys) * 3
+        self.lines_scored = 0
+        self.extra_lines = 0
+
+        self._correct_per_example = defaultdict(int)
+        self._correct_per_rule_class = defaultdict(int)
+        self._total_per_rule_class = defaultdict(int)
+        self._token_scores = defaultdict(int)
+        self._fast_path = 0
+
+    @property
+    def is_complete(self) -> bool:
+        return self.lines_scored == self.expected_lines
+
+    def add(self, output_text: str) -> None:
+        """
+        Score the next output line and add it to the aggregates.
+
+        Raises:
+            IceStaBSEvalException: If the output has more lines than the benchmark has examples.
+        """
+        if self.lines_scored >= self.expected_lines:
+            raise IceStaBSEvalException(
+                f"Invalid number of lines in file. Should be equal to {self.expected_lines}, found more."
+            )
+        example_index, rule_index = divmod(self.lines_scored, len(self._rule_keys))
+        rule = self._rule_keys[rule_index]
+        input_text = self._original_examples[rule][example_index]
+        reference_text = self._standardized_examples[rule][example_index]
+
+        with stage("score", tool=self.tool_name):
+            scores = token_level_eval(
+                input_text,
+                output_text,
+                reference_text,
+                benchmark_index=self.benchmark_index,
+            )
+        for score_name, score in zip(scores._fields, scores):
+            self._token_scores[score_name] += score
+
+        correct = int(output_text == reference_text)
+        rule_class = get_rule_class(rule)
+        self._correct_per_example[f"ex_{example_index + 1}"] += correct
+        self._correct_per_rule_class[rule_class] += correct
+        self._total_per_rule_class[rule_class] += 1
+        self._fast_path += int(is_fast_path(input_text, output_text, reference_text))
+        self.lines_scored += 1
+
+    def tables(self) -> Dict[str, DataFrame]:
+        """Generate the evaluation tables from the aggregates, in the same format as the single file evaluation."""
+        summary = {"tool": self.tool_name}
+        for example_id in sorted(self._correct_per_example):
+            summary[f"{example_id}_correct"] = self._correct_per_example[example_id]
+        summary["total_correct"] = sum(self._correct_per_example.values())
+        summary["Percentage"] = (
+            summary["total_correct"] / self.lines_scored * 100
+            if self.lines_scored > 0
+            else 0
+        )
+        summary_table = DataFrame([summary])
+
+        per_rule_table = DataFrame(
+            [
+                {
+                    "rule_class": rule_class,
+                    "total_possible": self._total_per_rule_class[rule_class],
+                    self.tool_name: self._correct_per_rule_class[rule_class],
+                }
+                for rule_class in sorted(self._total_per_rule_class)
+            ],
+            columns=["rule_class", "total_possible", self.tool_name],
+        )
+
+        f1_scores_table = f_score_per_tool(
+            DataFrame(
+                {
+                    "tool": [self.tool_name],
+                    "tp_score": [self._token_scores["true_positive"]],
+                    "fp_score": [self._token_scores["false_positive"]],
+                    "fn_score": [self._token_scores["false_negative"]],
+                }
+            )
+        )
+
+        fast_path_table = DataFrame(
+            {
+                "tool": [self.tool_name],
+                "cells": [self.lines_scored],
+                "fast_path": [self._fast_path],
+                "fast_path_rate": [
+                    self._fast_path / self.lines_scored if self.lines_scored > 0 else 0
+                ],
+            }
+        )
+
+        return {
+            "Score per example": summary_table,
+            "Score per rule chapter": per_rule_table,
+            "F1 scores per tool": f1_scores_table,
+            "Fast path hits per tool": fast_path_table,
+        }
+
+
+def evaluate_stream(
+    tool_name: str,
+    lines: Iterable[str],
+    rules: RulesContainer,
+    benchmark_index: Optional[BenchmarkTokenIndex] = None,
+    aligner: Union[str, Callable] = None,
+) -> StreamingEvaluation:
+    """
+    Evaluate the output lines of a single tool as a stream.
+
+    Lines after the last example of the benchmark are not scored. They are read to the end and
+    counted in the extra_lines of the evaluation, except empty lines, so that e.g. two copies of
+    an output file report the results of the first copy.
+
+    Args:
+        tool_name (str): Name of the tool being evaluated.
+        lines (Iterable[str]): The output lines, e.g. an open file. Trailing whitespace is stripped.
+        rules (RulesContainer): The benchmark rules.
+        benchmark_index (BenchmarkTokenIndex, optional): A shared benchmark token index.
+        aligner (str or callable, optional): The token alignment backend, if no benchmark index is given.
+    Returns:
+        StreamingEvaluation: The aggregated evaluation, which may be partial if the stream ended early.
+    """
+    evaluation = StreamingEvaluation(
+        tool_name, rules, benchmark_index=benchmark_index, aligner=aligner
+    )
+    for line in lines:
+        if evaluation.is_complete:
+            evaluation.extra_lines += int(line.strip() != "")
+        else:
+            evaluation.add(line.strip())
+    return evaluation
@@ -1,9 +1,135 @@
 from tokenizer import tokenize
+from importlib.metadata import PackageNotFoundError, version
+from array import array
 from collections import namedtuple
-from typing import List
+from itertools import repeat
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
 from difflib import SequenceMatcher
+from numpy import asarray, bincount, empty, frombuffer, int32, int64
+from .profiling import stage
 
 _EvaluationResults = namedtuple('EvaluationResults', ['true_positive', 'false_positive', 'true_negative', 'false_negative'])
+# the input token ids and the expected action codes of a benchmark sentence pair, as array('i')
+_ExpectedTokens = namedtuple('_ExpectedTokens', ['input_ids', 'expected_actions'])
+
+# An action is encoded as a single int, (token id << 2) | tag code, where the tag code is the index
+# of the tag in ACTION_TAGS. Two actions are the same iff their codes are equal, and 'equal' actions
+# are the codes with no tag bits set.
+ACTION_TAGS = ('equal', 'replace', 'delete', 'insert')
+_EQUAL, _REPLACE, _DELETE, _INSERT = range(len(ACTION_TAGS))
+_TAG_BITS = 2
+_TAG_MASK = (1 << _TAG_BITS) - 1
+
+
+def tokenize_text(text: str) -> List[str]:
+    """Tokenize a text and return the non-empty token strings."""
+    return [token.txt for token in tokenize(text) if token.txt != '']
+
+
+def tokenizer_version() -> str:
+    """The installed version of the tokenizer, as the tokens of a text may change with it."""
+    try:
+        return version('tokenizer')
+    except PackageNotFoundError:
+        return 'unknown'
+
+
+class TokenInterner:
+    """
+    Maps token strings to dense integer ids, so token sequences can be stored as int arrays and
+    compared as integers.
+
+    Each distinct token is stored once, however many sentences it occurs in. Ids are assigned in
+    order of first occurrence, and never change once assigned.
+
+    Attributes:
+        strings (List[str]): The token of each id.
+    """
+
+    def __init__(self, strings: Iterable[str] = ()):
+        self.strings: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self.intern_all(strings)
+
+    def intern(self, token: str) -> int:
+        """Get the id of a token, assigning a new id if the token has not been seen."""
+        token_id = self._ids.get(token)
+        if token_id is None:
+            token_id = self._ids[token] = len(self.strings)
+            self.strings.append(token)
+        return token_id
+
+    def intern_all(self, tokens: Iterable[str]) -> array:
+        """Get the ids of many tokens, as an array('i')."""
+        ids = self._ids
+        strings = self.strings
+        token_ids = array('i')
+        for token in tokens:
+            token_id = ids.get(token)
+            if token_id is None:
+                token_id = ids[token] = len(strings)
+                strings.append(token)
+            token_ids.append(token_id)
+        return token_ids
+
+    def decode_actions(self, codes: Iterable[int]) -> List[Tuple[str, str]]:
+        """Turn action codes back into (action, token) tuples, as returned by get_actions."""
+        return [
+            (ACTION_TAGS[code & _TAG_MASK], self.strings[code >> _TAG_BITS]) for code in codes
+        ]
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+
+class BenchmarkTokenIndex:
+    """
+    A reusable index of the benchmark side of the token level evaluation.
+
+    For every (original, standardized) sentence pair of the benchmark, the index stores the
+    tokenized original sentence and the expected actions (the alignment of the original to the
+    standardized sentence). The entries only depend on the benchmark, so a single index can be
+    shared by the evaluation of every tool column, instead of re-tokenizing and re-aligning the
+    same sentences once per tool.
+
+    Tokens are interned by the index's TokenInterner, which is also used for the tool outputs, so
+    the entries hold int arrays of token ids and action codes (see get_action_codes).
+
+    Entries are keyed by the sentence pair itself, so identical (rule, example) pairs share one entry.
+    The expected actions depend on the alignment backend, so the index is bound to a single aligner.
+    """
+
+    def __init__(self, aligner: Union[str, Callable] = None, interner: TokenInterner = None):
+        self.aligner = aligner if aligner is not None else DEFAULT_ALIGNER
+        self.align = get_aligner(self.aligner)
+        self.interner = interner if interner is not None else TokenInterner()
+        self._entries: Dict[Tuple[str, str], _ExpectedTokens] = {}
+
+    def add(self, input_text: str, reference_text: str) -> _ExpectedTokens:
+        """Tokenize and align a sentence pair and store the result in the index."""
+        input_ids = self.interner.intern_all(tokenize_text(input_text))
+        reference_ids = self.interner.intern_all(tokenize_text(reference_text))
+        expected_actions = get_action_codes(self.align(input_ids, reference_ids))
+        entry = _ExpectedTokens(input_ids, expected_actions)
+        self._entries[(input_text, reference_text)] = entry
+        return entry
+
+    def insert(self, input_text: str, reference_text: str, entry: _ExpectedTokens) -> None:
+        """Store a precomputed entry, with token ids of the index's interner, for a sentence pair."""
+        self._entries[(input_text, reference_text)] = entry
+
+    def get(self, input_text: str, reference_text: str) -> _ExpectedTokens:
+        """Get the entry for a sentence pair, adding it to the index if it is missing."""
+        entry = self._entries.get((input_text, reference_text))
+        if entry is None:
+            entry = self.add(input_text, reference_text)
+        return entry
+
+    def __contains__(self, pair: Tuple[str, str]) -> bool:
+        return pair in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
 
 def align_tokens(a_tokens, b_tokens):
     """
@@ -40,6 +166,167 @@ def align_tokens(a_tokens, b_tokens):
                 alignment.append((None, b_tokens[j]))
     return alignment
 
+
+# the byte marking the tokens of b_tokens that are not in a_tokens, see _match_masks
+_NO_MATCH = 255
+
+
+def _match_masks(a_tokens, b_tokens) -> Dict[object, int]:
+    """
+    Map each distinct token of a_tokens to the bit mask of its positions in b_tokens, bit j set if
+    b_tokens[j] is the token.
+
+    The masks are built in C: b_tokens is encoded as one byte per token, the index of the token
+    in a_tokens or _NO_MATCH, and each mask is parsed from that bytes object translated to binary
+    digits. With more distinct tokens in a_tokens than fit in a byte, the bits are set one by one.
+    """
+    codes = {}
+    for token in a_tokens:
+        if token not in codes:
+            codes[token] = len(codes)
+    if len(codes) > _NO_MATCH:
+        masks = dict.fromkeys(codes, 0)
+        for j, token in enumerate(b_tokens):
+            if token in masks:
+                masks[token] |= 1 << j
+        return masks
+    # the most significant digit first, so the digit of b_tokens[j] has the value 2 ** j
+    b_codes = bytes(map(codes.get, reversed(b_tokens), repeat(_NO_MATCH)))
+    masks = {}
+    for token, code in codes.items():
+        digits = bytearray(b'0' * 256)
+        digits[code] = ord('1')
+        masks[token] = int(b_codes.translate(digits), 2)
+    return masks
+
+
+def _bit_parallel_alignment(a_tokens, b_tokens):
+    """
+    Align a_tokens to b_tokens with a minimal edit distance, with the bit-parallel dynamic program
+    of Myers and Hyyrö.
+
+    Column i of the Levenshtein matrix D, over the rows j = 0..m of b_tokens, is encoded by bit
+    vectors of its vertical deltas D[i][j] - D[i][j - 1] (vp and vn, for +1 and -1), and its
+    horizontal deltas D[i][j] - D[i - 1][j] (ph and mh), as Python ints of m bits. Each column is
+    computed from the previous one with a few integer operations, so a_tokens, the benchmark
+    sentence, is iterated over while arbitrarily long outputs in b_tokens are handled in bulk.
+
+    The path is traced back from (n, m) as in the full matrix, preferring substitutions over
+    deletions over insertions. The moves are decided for all the rows of a column at once, as bit
+    masks of the rows where the path takes the diagonal or an insertion, so a run of insertions
+    is skipped in one step, and the traceback takes O(n) steps.
+    """
+    n, m = len(a_tokens), len(b_tokens)
+    if n == 0:
+        return [(None, b_token) for b_token in b_tokens]
+    if m == 0:
+        return [(a_token, None) for a_token in a_tokens]
+
+    match_masks = _match_masks(a_tokens, b_tokens)
+    mask = (1 << m) - 1
+    # column 0, D[0][j] = j
+    vp, vn = mask, 0
+    # the diagonal and insertion masks of each column, bit j for the move from (i, j)
+    moves = [None]
+    for token in a_tokens:
+        eq = match_masks[token]
+        # the vertical deltas of the previous column, shifted to the bits of their rows
+        previous_p, previous_n = vp << 1, vn << 1
+        xv = eq | vn
+        xh = (((eq & vp) + vp) ^ vp) | eq
+        # the horizontal delta of row 0 is always +1, as D[i][0] = i
+        ph = (vn | ~(xh | vp)) << 1 | 1
+        mh = (vp & xh) << 1
+        vp = (mh | ~(xv | ph)) & mask
+        vn = ph & xv
+        # D[i - 1][j - 1] + cost == D[i][j], either a match, or +1 from one delta and 0 from the other
+        diagonal = (
+            eq << 1
+            | ph & ~(previous_p | previous_n)
+            | previous_p & ~(ph | mh)
+        )
+        # a deletion if D[i - 1][j] + 1 == D[i][j], i.e. ph, else an insertion
+        insertion = ~(diagonal | ph) & mask << 1
+        moves.append((diagonal, insertion))
+
+    alignment = []
+    i, j = n, m
+    while i > 0 and j > 0:
+        diagonal, insertion = moves[i]
+        if diagonal >> j & 1:
+            alignment.append((a_tokens[i - 1], b_tokens[j - 1]))
+            i -= 1
+            j -= 1
+        elif insertion >> j & 1:
+            # the highest row below j that is not an insertion ends the run
+            end = (~insertion & ((1 << j) - 1)).bit_length() - 1
+            alignment.extend(zip(repeat(None), reversed(b_tokens[end:j])))
+            j = end
+        else:
+            alignment.append((a_tokens[i - 1], None))
+            i -= 1
+    alignment.extend(zip(reversed(a_tokens[:i]), repeat(None)))
+    alignment.extend(zip(repeat(None), reversed(b_tokens[:j])))
+    alignment.reverse()
+    return alignment
+
+
+def align_tokens_levenshtein(a_tokens, b_tokens):
+    """
+    Align tokens from a_tokens to b_tokens with a minimal token edit distance (Levenshtein) alignment.
+
+    The common prefix and suffix are aligned directly, and the rest is aligned with a bit-parallel
+    dynamic program, see _bit_parallel_alignment. It takes O(n) integer operations on m-bit ints
+    for n tokens in a_tokens and m in b_tokens, so it is faster than SequenceMatcher on long
+    outputs (see benchmarks/aligners.py), and the result does not depend on any junk heuristics.
+
+    Returns a list of tuples in the same format as align_tokens.
+    """
+    n, m = len(a_tokens), len(b_tokens)
+    prefix = 0
+    while prefix < n and prefix < m and a_tokens[prefix] == b_tokens[prefix]:
+        prefix += 1
+    suffix = 0
+    while (
+        suffix < n - prefix
+        and suffix < m - prefix
+        and a_tokens[n - 1 - suffix] == b_tokens[m - 1 - suffix]
+    ):
+        suffix += 1
+
+    alignment = list(zip(a_tokens[:prefix], b_tokens[:prefix]))
+    alignment.extend(
+        _bit_parallel_alignment(a_tokens[prefix : n - suffix], b_tokens[prefix : m - suffix])
+    )
+    alignment.extend(zip(a_tokens[n - suffix :], b_tokens[m - suffix :]))
+    return alignment
+
+
+# the available alignment backends, by name
+ALIGNERS = {
+    'difflib': align_tokens,
+    'levenshtein': align_tokens_levenshtein,
+}
+DEFAULT_ALIGNER = 'difflib'
+
+
+def get_aligner(aligner: Union[str, Callable]) -> Callable:
+    """
+    Get an alignment function by name, or return the given alignment function as is.
+
+    During the evaluation, alignment functions are called with sequences of interned token ids
+    (see TokenInterner), so they only need to compare tokens for equality.
+    """
+    if callable(aligner):
+        return aligner
+    try:
+        return ALIGNERS[aligner]
+    except KeyError:
+        raise ValueError(
+            f"Unknown aligner '{aligner}'. Available aligners: {', '.join(ALIGNERS)}"
+        )
+
+
 def get_actions(alignment):
     """
     Given an alignment list, returns a list of actions corresponding to each token in the reference.
@@ -63,6 +350,71 @@ def get_actions(alignment):
     return actions
 
 
+def get_action_codes(alignment) -> array:
+    """
+    Given an alignment of token ids, returns the action of each token as an int code, in an array('i').
+
+    The actions are those of get_actions, encoded as (token id << 2) | tag code, where the tag code
+    is the index of the action in ACTION_TAGS.
+    """
+    codes = array('i')
+    for a_id, b_id in alignment:
+        if a_id == b_id:
+            codes.append(b_id << _TAG_BITS)
+        elif a_id is None:
+            codes.append(b_id << _TAG_BITS | _INSERT)
+        elif b_id is None:
+            codes.append(a_id << _TAG_BITS | _DELETE)
+        else:
+            codes.append(b_id << _TAG_BITS | _REPLACE)
+    return codes
+
+
+def compare_action_codes(expected_codes: Sequence[int], observed_codes: Sequence[int]):
+    """
+    Compare two sequences of action codes (see get_action_codes), like compare_actions.
+
+    Returns:
+        Tuple[int, int, int, int]: The true positive, false positive, true negative and false negative counts.
+    """
+    tp = fp = fn = tn = 0
+    for expected, observed in zip(expected_codes, observed_codes):
+        if expected & _TAG_MASK:
+            if expected == observed:
+                tp += 1  # Correctly changed
+            else:
+                if (expected ^ observed) & _TAG_MASK:
+                    fn += 1  # Expected change did not happen
+                if observed & _TAG_MASK:
+                    fp += 1  # Incorrect or unexpected change
+        elif observed & _TAG_MASK:
+            fp += 1  # Should not have been changed but was
+        else:
+            tn += 1  # Correctly unchanged
+    return tp, fp, tn, fn
+
+
+def _compare_action_codes_many(expected_codes, observed_codes, segments, num_segments: int):
+    """
+    Compare the action codes of many outputs at once, with vectorized NumPy operations.
+
+    The codes of all outputs are concatenated, and segments holds the output number of each position.
+    Returns the counts of compare_action_codes per output, as a (4, num_segments) array.
+    """
+    expected_tags = expected_codes & _TAG_MASK
+    observed_tags = observed_codes & _TAG_MASK
+    expected_change = expected_tags != 0
+    observed_change = observed_tags != 0
+    same = expected_codes == observed_codes
+    masks = (
+        expected_change & same,
+        observed_change & ~same,
+        ~expected_change & ~observed_change,
+        expected_change & (expected_tags != observed_tags),
+    )
+    return asarray([bincount(segments[mask], minlength=num_segments) for mask in masks])
+
+
 def compare_actions(expected_actions, observed_actions):
     tp = fp = fn = tn = 0
     # print(expected_actions)
@@ -179,26 +531,178 @@ def true_negative(observed_actions, expected_actions):
     return score
 
 
-def token_level_eval(input_text: str, output_text: str, reference_text: str):
-    input_tokens = [token.txt for token in tokenize(input_text) if token.txt != '']
-    output_tokens = [token.txt for token in tokenize(output_text) if token.txt != '']
-    reference_tokens = [token.txt for token in tokenize(reference_text) if token.txt != '']
+def _resolve_benchmark_index(
+    benchmark_index: Optional[BenchmarkTokenIndex], aligner: Union[str, Callable]
+) -> BenchmarkTokenIndex:
+    if benchmark_index is None:
+        return BenchmarkTokenIndex(aligner=aligner)
+    if aligner is not None and get_aligner(aligner) is not benchmark_index.align:
+        raise ValueError(
+            f"The aligner '{aligner}' does not match the aligner of the benchmark index ('{benchmark_index.aligner}')"
+        )
+    return benchmark_index
 
-    # Align tokens
-    expected_alignment = align_tokens(input_tokens, reference_tokens)
-    observed_alignment = align_tokens(input_tokens, output_tokens)
-    
 
-    # Get actions
-    expected_actions = get_actions(expected_alignment)
-    observed_actions = get_actions(observed_alignment)
+def is_fast_path(input_text: str, output_text: str, reference_text: str) -> bool:
+    """Whether an output is scored on the fast path, i.e. is identical to its input or reference."""
+    return output_text == reference_text or output_text == input_text
+
+
+def _fast_path_scores(
+    input_text: str, output_text: str, reference_text: str, expected: _ExpectedTokens
+) -> Optional[_EvaluationResults]:
+    """
+    Calculate the scores of an output that is identical to the input or the reference, without tokenizing it.
+
+    If the output is the reference, the observed actions are the expected actions, so every expected change
+    is a true positive and every unchanged token a true negative. If the output is the input, every token
+    is observed as unchanged, so every expected change is a false negative and every other position
+    (including the padding of the shorter action list) a true negative.
+
+    Returns None if neither case applies.
+    """
+    if output_text == reference_text:
+        changes = sum(1 for code in expected.expected_actions if code & _TAG_MASK)
+        return _EvaluationResults(changes, 0, len(expected.expected_actions) - changes, 0)
+    if output_text == input_text:
+        changes = sum(1 for code in expected.expected_actions if code & _TAG_MASK)
+        positions = max(len(expected.expected_actions), len(expected.input_ids))
+        return _EvaluationResults(0, 0, positions - changes, changes)
+    return None
+
+
+def _padded_action_codes(
+    benchmark_index: BenchmarkTokenIndex, expected: _ExpectedTokens, output_ids: array
+) -> Tuple[array, array]:
+    """The expected and observed action codes of an output, padded to the same length with 'equal' actions."""
+    observed_codes = get_action_codes(benchmark_index.align(expected.input_ids, output_ids))
+    expected_codes = array('i', expected.expected_actions)
+    padding = len(observed_codes) - len(expected_codes)
+    if padding > 0:
+        expected_codes.extend(array('i', [_EQUAL]) * padding)
+    elif padding < 0:
+        observed_codes.extend(array('i', [_EQUAL]) * -padding)
+    return expected_codes, observed_codes
+
+
+def token_level_eval(
+    input_text: str,
+    output_text: str,
+    reference_text: str,
+    benchmark_index: Optional[BenchmarkTokenIndex] = None,
+    aligner: Union[str, Callable] = None,
+):
+    """
+    Evaluate a single tool output on the token level.
+
+    Args:
+        input_text (str): The original (unstandardized) sentence.
+        output_text (str): The output of the tool for the original sentence.
+        reference_text (str): The standardized (expected) sentence.
+        benchmark_index (BenchmarkTokenIndex, optional): A shared index of tokenized benchmark sentences.
+            If given, the input tokens and expected actions are looked up (and cached) in the index
+            instead of being computed for every call.
+            Outputs that are identical to the input or the reference are scored directly from the expected
+            actions (see is_fast_path), without tokenizing or aligning the output.
+        aligner (str or callable, optional): The alignment backend, 'difflib' (the default, SequenceMatcher based)
+            or 'levenshtein', or an alignment function. Must match the aligner of the benchmark index, if given.
+
+    Returns:
+        EvaluationResults: The true positive, false positive, true negative and false negative token counts.
+    """
+    benchmark_index = _resolve_benchmark_index(benchmark_index, aligner)
+    expected = benchmark_index.get(input_text, reference_text)
+    fast_path_results = _fast_path_scores(input_text, output_text, reference_text, expected)
+    if fast_path_results is not None:
+        return fast_path_results
+    with stage("tokenize"):
+        output_ids = benchmark_index.interner.intern_all(tokenize_text(output_text))
+    with stage("align"):
+        expected_codes, observed_codes = _padded_action_codes(
+            benchmark_index, expected, output_ids
+        )
+    with stage("compare"):
+        tp, fp, tn, fn = compare_action_codes(expected_codes, observed_codes)
+
+    return _EvaluationResults(tp, fp, tn, fn)
+
+def token_level_eval_many(
+    inputs: Iterable[str],
+    outputs: Iterable[str],
+    references: Iterable[str],
+    benchmark_index: Optional[BenchmarkTokenIndex] = None,
+    aligner: Union[str, Callable] = None,
+) -> _EvaluationResults:
+    """
+    Evaluate many tool outputs on the token level.
+
+    Identical (input, output, reference) triples are only scored once, and outputs that are identical to
+    their input or reference take the fast path of token_level_eval.
+
+    Args:
+        inputs (Iterable[str]): The original (unstandardized) sentences.
+        outputs (Iterable[str]): The outputs of the tool, aligned with the inputs.
+        references (Iterable[str]): The standardized (expected) sentences, aligned with the inputs.
+        benchmark_index (BenchmarkTokenIndex, optional): A shared index of tokenized benchmark sentences.
+        aligner (str or callable, optional): The alignment backend, see token_level_eval.
+
+    Returns:
+        EvaluationResults: NumPy integer arrays with the true positive, false positive, true negative
+            and false negative token counts of each output.
+
+    Raises:
+        ValueError: If the inputs, outputs and references are not of the same length.
+    """
+    benchmark_index = _resolve_benchmark_index(benchmark_index, aligner)
+    inputs, outputs, references = list(inputs), list(outputs), list(references)
+    if not len(inputs) == len(outputs) == len(references):
+        raise ValueError(
+            f"The inputs, outputs and references must be of the same length, got {len(inputs)}, {len(outputs)} and {len(references)}"
+        )
+
+    # the column of each distinct triple, and the scores of each column
+    columns: Dict[Tuple[str, str, str], int] = {}
+    cell_columns = empty(len(inputs), dtype=int64)
+    for i, triple in enumerate(zip(inputs, outputs, references)):
+        cell_columns[i] = columns.setdefault(triple, len(columns))
+    unique_scores = empty((len(_EvaluationResults._fields), len(columns)), dtype=int64)
+
+    # the benchmark entries, tokenized and aligned on first use, and the scores on the fast path
+    slow_cells = []
+    with stage("benchmark", items=len(columns)):
+        for (input_text, output_text, reference_text), column in columns.items():
+            expected = benchmark_index.get(input_text, reference_text)
+            result = _fast_path_scores(input_text, output_text, reference_text, expected)
+            if result is None:
+                slow_cells.append((column, expected, output_text))
+            else:
+                unique_scores[:, column] = result
 
-    # Ensure both action lists are the same length
-    max_len = max(len(expected_actions), len(observed_actions))
-    expected_actions.extend([('equal', '')] * (max_len - len(expected_actions)))
-    observed_actions.extend([('equal', '')] * (max_len - len(observed_actions)))
+    with stage("tokenize", items=len(slow_cells)):
+        intern_all = benchmark_index.interner.intern_all
+        output_ids = [intern_all(tokenize_text(output_text)) for _, _, output_text in slow_cells]
 
-    # Compare actions
-    tp, fp, tn, fn = compare_actions(expected_actions, observed_actions)
+    # the outputs off the fast path are aligned one by one, and their actions compared all at once
+    expected_codes = array('i')
+    observed_codes = array('i')
+    segments = array('i')
+    slow_columns = []
+    with stage("align", items=len(slow_cells)):
+        for (column, expected, _), ids in zip(slow_cells, output_ids):
+            expected_actions, observed_actions = _padded_action_codes(
+                benchmark_index, expected, ids
+            )
+            expected_codes.extend(expected_actions)
+            observed_codes.extend(observed_actions)
+            segments.extend(array('i', [len(slow_columns)]) * len(expected_actions))
+            slow_columns.append(column)
 
-    return _EvaluationResults(tp, fp, tn, fn)
\ No newline at end of file
+    if slow_columns:
+        with stage("compare", items=len(slow_columns)):
+            unique_scores[:, slow_columns] = _compare_action_codes_many(
+                frombuffer(expected_codes, dtype=int32),
+                frombuffer(observed_codes, dtype=int32),
+                frombuffer(segments, dtype=int32),
+                len(slow_columns),
+            )
+    return _EvaluationResults(*unique_scores[:, cell_columns])
@@ -0,0 +1,48 @@
+import mmap
+
+import pytest
+
+from icestabs_evaluation import IceStaBSEvalException
+from icestabs_evaluation import compiled_benchmark
+from icestabs_evaluation.compiled_benchmark import (
+    _HEADER,
+    _MAGIC,
+    FORMAT_VERSION,
+    CompiledBenchmark,
+)
+
+
+def _header(magic=_MAGIC, version=FORMAT_VERSION, num_rules=0):
+    return _HEADER.pack(magic, version, b"", b"levenshtein", b"", 0, 0, 0, num_rules, 0, 0, 0)
+
+
+@pytest.fixture
+def maps(monkeypatch):
+    """The memory maps opened by CompiledBenchmark."""
+    opened = []
+
+    class RecordingMap(mmap.mmap):
+        def __init__(self, *args, **kwargs):
+            opened.append(self)
+
+    monkeypatch.setattr(compiled_benchmark.mmap, "mmap", RecordingMap)
+    return opened
+
+
+@pytest.mark.parametrize(
+    "contents, message",
+    [
+        (b"", "not a compiled benchmark file"),
+        (b"ISBC", "not a compiled benchmark file"),
+        (_header(magic=b"XXXX"), "not a compiled benchmark file"),
+        (_header(version=FORMAT_VERSION - 1), "Unsupported compiled benchmark version"),
+        (_header(num_rules=10), "truncated"),
+    ],
+    ids=["empty", "short", "magic", "version", "truncated"],
+)
+def test_a_failed_check_closes_the_map(tmp_path, maps, contents, message):
+    path = tmp_path / "benchmark.isbc"
+    path.write_bytes(contents)
+    with pytest.raises(IceStaBSEvalException, match=message):
+        CompiledBenchmark(str(path))
+    assert all(opened.closed for opened in maps)
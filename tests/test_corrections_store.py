@@ -0,0 +1,24 @@
+import pytest
+
+from icestabs_evaluation import IceStaBSEvalException
+from icestabs_evaluation.corrections_store import CorrectionsStore
+
+
+def test_write_column_rejects_a_column_of_another_length(tmp_path):
+    store = CorrectionsStore(str(tmp_path))
+    store.write_column("rule", ["1.1", "1.2"])
+    with pytest.raises(IceStaBSEvalException):
+        store.write_column("ex_1_original", ["a", "b", "c"])
+
+
+def test_dropping_every_column_allows_another_length(tmp_path):
+    store = CorrectionsStore(str(tmp_path))
+    store.write_column("rule", ["1.1", "1.2"])
+    store.write_column("ex_1_original", ["a", "b"])
+    for column in store.columns:
+        store.drop_column(column)
+
+    store.write_column("rule", ["1.1", "1.2", "1.3"])
+    reopened = CorrectionsStore(str(tmp_path))
+    assert reopened.num_rows == 3
+    assert reopened.read()["rule"].tolist() == ["1.1", "1.2", "1.3"]
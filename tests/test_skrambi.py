@@ -0,0 +1,85 @@
+import pytest
+import requests
+
+from mock_skrambi import start_mock_server
+from skrambi_client import SkrambiAnnotation, SkrambiClient, apply_skrambi_corrections
+
+SENTENCES = [
+    "Ég sá hunt í gær.",
+    "Hann vildi seigja eitthvað.",
+    "Þetta er góður texti.",
+    "Textinn er vilaus en eftilvill ekki.",
+    "Ég hef alldrei séð hunt og annan hunt.",
+]
+
+CORRECTED = [
+    "Ég sá hund í gær.",
+    "Hann vildi segja eitthvað.",
+    "Þetta er góður texti.",
+    "Textinn er villulaus en ef til vill ekki.",
+    "Ég hef aldrei séð hund og annan hund.",
+]
+
+
+@pytest.fixture
+def mock_skrambi(request):
+    """The checkDocument url of a mock server, failing every n-th request for fail_every=n."""
+    server, url = start_mock_server(fail_every=getattr(request, "param", 0))
+    yield server, url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_check_sentences_maps_offsets_back_to_the_sentences(mock_skrambi, concurrency):
+    _, url = mock_skrambi
+    # a budget of about two sentences, so the document is sent in several chunks
+    with SkrambiClient(url, max_chunk_chars=60, concurrency=concurrency) as client:
+        annotations = client.check_sentences(SENTENCES)
+    assert [annotation.targetWord for annotation in annotations] == [
+        "hunt",
+        "seigja",
+        "vilaus",
+        "eftilvill",
+        "alldrei",
+        "hunt",
+        "hunt",
+    ]
+    assert apply_skrambi_corrections(SENTENCES, annotations) == CORRECTED
+
+
+@pytest.mark.parametrize("mock_skrambi", [2], indirect=True)
+def test_check_sentences_retries_failed_requests(mock_skrambi):
+    server, url = mock_skrambi
+    with SkrambiClient(url, max_chunk_chars=60, concurrency=1, backoff=0) as client:
+        annotations = client.check_sentences(SENTENCES)
+    assert apply_skrambi_corrections(SENTENCES, annotations) == CORRECTED
+    # every other request failed with a 503 and was sent again
+    num_chunks = 3
+    assert server.RequestHandlerClass.requests_served == 2 * num_chunks - 1
+
+
+@pytest.mark.parametrize("mock_skrambi", [1], indirect=True)
+def test_check_sentences_raises_when_the_retries_run_out(mock_skrambi):
+    server, url = mock_skrambi
+    with SkrambiClient(url, retries=2, backoff=0) as client:
+        with pytest.raises(requests.HTTPError, match="503"):
+            client.check_sentences(SENTENCES)
+    assert server.RequestHandlerClass.requests_served == 3
+
+
+def test_apply_skrambi_corrections_skips_mismatched_and_overlapping_spans():
+    sentences = ["Ég sá hunt.", "Hann vildi seigja."]
+    annotations = [
+        # the offsets drifted by one character, so the span does not match the word
+        SkrambiAnnotation(7, 11, "hunt", ["hund"], "spelling"),
+        SkrambiAnnotation(23, 29, "seigja", ["segja"], "spelling"),
+        # overlaps the annotation before it
+        SkrambiAnnotation(25, 29, "igja", ["x"], "spelling"),
+        # no suggestion to replace it with
+        SkrambiAnnotation(12, 16, "Hann", [], "spelling"),
+    ]
+    assert apply_skrambi_corrections(sentences, annotations) == [
+        "Ég sá hunt.",
+        "Hann vildi segja.",
+    ]
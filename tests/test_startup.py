@@ -0,0 +1,21 @@
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# only loaded when an evaluation needs them, see benchmarks/startup.py
+HEAVY_MODULES = ["pandas", "numpy", "tokenizer", "yaml", "rich"]
+
+
+def test_cli_import_does_not_load_heavy_modules():
+    check = (
+        "import icestabs_evaluation.cli, sys; "
+        f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [SRC, env.get("PYTHONPATH")]))
+    output = subprocess.run(
+        [sys.executable, "-c", check], check=True, capture_output=True, text=True, env=env
+    ).stdout
+    assert output.split() == []